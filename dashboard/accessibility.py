@@ -0,0 +1,159 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+import data_cache
+import district_layer
+import facilities
+import geometry_store
+
+# Lagekriterium: distance from every grid cell to the nearest Kita, Schule, Arzt and
+# ÖPNV stop. Cells and facilities are in UTM32 (metres); one cKDTree per facility layer
+# answers all cells in a single bulk query spread over all cores (workers=-1).
+# Trees and distances are cached per layer together with the fingerprint of its point
+# file, so a changed layer is recomputed alone. Residents are spread evenly over the
+# cells of their district (there are no address coordinates in Input/).
+
+CELL_SIZE = 100            # metres
+AGE_GROUPS = (("0–5", 0, 5), ("6–17", 6, 17), ("18–64", 18, 64), ("65+", 65, None))
+
+_grid = None
+_layers = {}               # key -> (fingerprint, distances per cell)
+_lock = threading.Lock()
+
+
+class Grid:
+    """
+    xy: (cells, 2) UTM32 cell centres inside the districts
+    district: district row (geometry_store order) per cell
+    weight: residents per cell (district residents / cells of the district)
+    """
+
+    def __init__(self, xy, district, weight):
+        self.xy = xy
+        self.district = district
+        self.weight = weight
+
+
+def _build_grid():
+    store = geometry_store.districts()
+    polygons = store.utm.geometry.to_numpy()
+    x0, y0, x1, y1 = store.utm.total_bounds
+    xs = np.arange(x0 + CELL_SIZE / 2, x1, CELL_SIZE)
+    ys = np.arange(y0 + CELL_SIZE / 2, y1, CELL_SIZE)
+    xy = np.column_stack([np.repeat(xs, len(ys)), np.tile(ys, len(xs))])
+    rows = facilities.assign(xy, polygons)
+    inside = rows >= 0
+    xy, rows = xy[inside], rows[inside]
+
+    residents = pd.to_numeric(store.utm[facilities.POPULATION_COL], errors="coerce").fillna(0).to_numpy(dtype=float)
+    cells = np.bincount(rows, minlength=len(polygons))
+    weight = residents[rows] / np.maximum(cells[rows], 1)
+    return Grid(xy, rows, weight)
+
+
+def grid():
+    global _grid
+    if _grid is None:
+        with _lock:
+            if _grid is None:
+                _grid = _build_grid()
+    return _grid
+
+
+def reset():
+    """Drops the grid and the per-layer distances (geometry or point files changed)."""
+    global _grid
+    with _lock:
+        _grid = None
+        _layers.clear()
+
+
+def distances(key):
+    """Metres from every grid cell to the nearest facility of a layer, or None without point data."""
+    from scipy.spatial import cKDTree
+
+    source = facilities.point_source(key)
+    if source is None:
+        return None
+    fp = data_cache.fingerprint(source)
+    cached = _layers.get(key)
+    if cached is not None and cached[0] == fp:
+        return cached[1]
+
+    points = facilities.load_points(key)
+    points = points[np.isfinite(points).all(axis=1)]
+    if len(points) == 0:
+        return None
+    tree = cKDTree(points)
+    dist, _ = tree.query(grid().xy, k=1, workers=-1)
+    with _lock:
+        _layers[key] = (fp, dist)
+    return dist
+
+
+def district_summary():
+    """
+    Residents-weighted mean distance (m) per district (index: district ID) and layer;
+    NaN for layers without point data.
+    """
+    g = grid()
+    store = geometry_store.districts()
+    n = len(store.utm)
+    den = np.bincount(g.district, weights=g.weight, minlength=n)
+    table = pd.DataFrame(index=store.utm[facilities.ID_COL].astype(str).to_numpy())
+    for key in facilities.LAYERS:
+        dist = distances(key)
+        if dist is None:
+            table[key] = np.nan
+            continue
+        num = np.bincount(g.district, weights=g.weight * dist, minlength=n)
+        table[key] = np.divide(num, den, out=np.full(n, np.nan), where=den > 0)
+    return table
+
+
+def _age_group_population(cube, district_ids):
+    """(districts, age groups) residents from a population cube, rows in district_ids order."""
+    if not cube.has_districts:
+        return None
+    by_age = cube.counts[:, :-1].sum(axis=(2, 3))                    # (cube district, age)
+    groups = np.stack([
+        by_age[:, lo:(None if hi is None else hi + 1)].sum(axis=1) for _, lo, hi in AGE_GROUPS
+    ], axis=1)
+    out = np.zeros((len(district_ids), len(AGE_GROUPS)))
+    row = {d: i for i, d in enumerate(district_ids)}
+    reg = district_layer.registry()
+    for label, counts in zip(cube.districts, groups):
+        i = row.get(reg.district_id(str(label)))
+        if i is not None:
+            out[i] += counts
+    return out
+
+
+def age_group_summary(cube, selection=None):
+    """
+    Mean distance (m) per age group (rows) and layer (columns) over the selected
+    Stadtteile. Without districts in the cube every group gets the residents'
+    mean of the selected districts.
+    """
+    table = district_summary()
+    reg = district_layer.registry()
+    ids = table.index.to_list()
+    selected = ids if selection is None else [i for i in (reg.district_id(s) for s in selection) if i]
+    mask = np.isin(ids, selected)
+
+    pop = _age_group_population(cube, ids)
+    if pop is None:
+        residents = geometry_store.districts().utm[facilities.POPULATION_COL]
+        residents = pd.to_numeric(residents, errors="coerce").fillna(0).to_numpy(dtype=float)
+        pop = np.repeat(residents[:, None], len(AGE_GROUPS), axis=1)
+    pop = pop * mask[:, None]
+
+    out = pd.DataFrame(index=[label for label, _, _ in AGE_GROUPS])
+    for key in facilities.LAYERS:
+        d = table[key].to_numpy()
+        ok = np.isfinite(d)
+        w = pop[ok].sum(axis=0)
+        out[key] = np.divide((pop[ok] * d[ok, None]).sum(axis=0), w, out=np.full(len(w), np.nan), where=w > 0)
+    return out
@@ -1,60 +1,62 @@
+import asyncio
+
 import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.ticker as mticker
 from faicons import icon_svg
-import plotly.express as px
-import plotly.graph_objects as go
-import geopandas as gpd
-from shinywidgets import render_plotly, render_widget
+from shinywidgets import render_widget
+from shiny import reactive, req
+from shiny.session import get_current_session
 from shiny.express import input, render, ui
-from ipyleaflet import Map as IpylMap, GeoJSON as IpylGeoJSON
-from ipywidgets import HTML
-from ipyleaflet import Map, Marker, Popup, Polygon
-#from shiny import reactive, ui
-import plotly.graph_objects as go
-from plotly.offline import init_notebook_mode, iplot
-from plotly.io import to_html
-# reusable chart functions
-from pie_chart import pie_chart_from_column
-from election_bar_chart import election_bar_chart
+# Heavy libraries (plotly, ipyleaflet, geopandas) are imported inside the outputs that
+# need them, so they load on first render; check with `python importtime.py`.
 # num data functions
 import num_data
-from shiny import reactive, ui as classic_ui  # classic_ui.include_html
-
-# === Load population data ===
-df_pyr = pd.read_excel("../Input/2022.xlsx")
-df_st = gpd.read_file("../Input/stadtteil.geojson")
-bv = pd.read_csv("../Input/bevoelkerung.csv")
-wa = pd.read_csv("../Input/wahlen.csv")
-df_kos = pd.read_csv("../data/k5000.csv")
-
-
-
-MAP_PATHS = {
-    "btn_stadt":   r"../Input/Stadtteil.html",
-    "btn_lage":    r"../Input/Pkte_Lage.html",
-    "btn_kita":   r"../Input/Pkte_Kita.html",
-    "btn_schule": r"../Input/Pkte_Schule.html",
-    "btn_arzt":   r"../Input/Pkte_Arzt.html",
-    "btn_opnv":   r"../Input/Pkte_Oepnv.html",
-}
-
-
-
-# Ensure WGS84 for leaflet
-df_st = df_st.set_crs(epsg=25832).to_crs(epsg=4326)
-
-# Coerce types defensively
-if "Alter" in df_pyr.columns:
-    df_pyr["Alter"] = pd.to_numeric(df_pyr["Alter"], errors="coerce")
-for col in ["Männer", "Frauen"]:
-    if col in df_pyr.columns:
-        df_pyr[col] = pd.to_numeric(df_pyr[col], errors="coerce").fillna(0)
-# Create reactive values to store clicked feature info
+import map_assets
+import district_layer
+import district_metrics
+import pyramid_years
+import forecast
+import forecast_mc
+import facilities
+import elections
+import accessibility
+import transit
+import reactive_utils
+import profiling
+import figures
+import plotly_output
+
+# === Population data: loaded once per process through the columnar cache (datasets.py) ===
+# In serving mode a new session first switches to the newest shared data generation
+import datasets
+import data_watcher
+datasets.refresh()
+from datasets import STADTTEILE
+
+# Changed files in Input/ and data/ are reloaded in the background (data_watcher.py).
+# Outputs read the datasets through these calcs, so a reload only invalidates the
+# outputs that depend on the replaced source; the filter selection stays as it is
+data_watcher.start()
+pyr_cube, kos_cube, kos_freq, bv = data_watcher.live("pyr_cube", "kos_cube", "kos_freq", "bv")
+# versions of the sources other modules load on first use: calling one makes an output
+# re-render after that source was reloaded
+geometry, facility_points, year_tables, election_files, transit_feed = data_watcher.live(
+    "geometry", "facilities", "pyramid_years", "elections", "transit")
+
+# trace of the session with DASHBOARD_TRACE=1 (payload bytes are counted in asgi.py); metrics on /metrics
+profiling.track_session(get_current_session())
 
 # === UI ===
 ui.page_opts(title="Statistikdaten 2024 | Ludwigshafen am Rhein", fillable=True)
+ui.head_content(plotly_output.head(), district_layer.head())
+
+with ui.sidebar(title="Filter"):
+    ui.input_checkbox_group("city_districts", "Stadtteile", STADTTEILE, selected=STADTTEILE)
+
+# Every output below reads the debounced selection: a burst of clicks on the
+# checkboxes reaches the pyramid, forecast, KPIs and tables once, with the last value
+selected_districts = reactive_utils.debounce(reactive_utils.FILTER_DEBOUNCE_SECS)(input.city_districts)
+# plot output id (or its band traces) -> key of the data last sent by Plotly.restyle in this session
+restyled = {}
 
 # ------------------------- Dashboard -----------------------------------
 
@@ -64,95 +66,50 @@ with ui.layout_columns(fill=False):
     with ui.card(style="height: 700px;", full_screen=True):
         ui.card_header("Alterspyramide")
 
-        @render.ui
-        def alterspyramide():
-            from plotly.io import to_html
-            import plotly.graph_objects as go
-            d = agg_by_age().copy()
-
-            # Left side should be negative for Männer to mirror the pyramid
-            d_plot = d.copy()
-            d_plot["Männer"] = -d_plot["Männer"].abs()
-
-            # Create the plot using Plotly
-            fig = go.Figure()
-
-            # Add Men data (left side, negative values)
-            fig.add_trace(go.Bar(
-                y=d_plot["Alter"],
-                x=d_plot["Männer"]/1000,
-                orientation='h',
-                name='Männer',
-                marker=dict(color='light blue'),
-                hoverinfo='x+y+name',
-                hovertemplate='<b>Männer</b><br>Alter: %{y}<br>Anzahl: %{x}<extra></extra>'
-            ))
-
-            # Add Women data (right side, positive values)
-            fig.add_trace(go.Bar(
-                y=d_plot["Alter"],
-                x=d_plot["Frauen"]/1000,
-                orientation='h',
-                name='Frauen',
-                marker=dict(color='pink'),
-                hoverinfo='x+y+name',
-                hovertemplate='<b>Frauen</b><br>Alter: %{y}<br>Anzahl: %{x}<extra></extra>'
-            ))
-
-            # Update layout for pyramid appearance
-            fig.update_layout(
-                barmode='overlay',
-                yaxis=dict(
-                    title='Alter in Jahren',
-                    range=[0,100]  # Adjust range as needed
-                ),
-                xaxis=dict(
-                    title='Anzahl',
-                    # tickvals=[-150, -100, -50, 0, 50, 100, 150],
-                   # ticktext=['150', '50', '0', '50', '150'],
-                ),
-                showlegend=True,
-                #title="Bevölkerungspyramide",
-                bargap=0.1,
-                height=650,  # Set fixed height in pixels
-                width=None  # Let width be responsive
-            )
-
-            # Convert to HTML and return as UI
-            # Convert to HTML and wrap in responsive container
-            html_content = to_html(fig, include_plotlyjs=True, config={'responsive': True})
-            return ui.HTML(f'<div style="height: 100%; width: 100%;">{html_content}</div>')
-
-
-            """
-            # Left side should be negative for Männer to mirror the pyramid
-            d_plot = d.copy()
-            d_plot["Männer"] = -d_plot["Männer"].abs()
-
-            fig, ax = plt.subplots(figsize=(10, 6))
-            ax.barh(d_plot["Alter"], d_plot["Männer"], label="Männer")
-            ax.barh(d_plot["Alter"], d_plot["Frauen"], label="Frauen")
-
-            ax.set_xlabel("Bevölkerungszahl")
-            ax.set_ylabel("Alter")
-            ax.set_title("Bevölkerungspyramide")
-            ax.legend()
-
-            # Symmetric x-limits
-            max_val = max(d_plot["Frauen"].max(), abs(d_plot["Männer"].min()))
-            ax.set_xlim(-max_val, max_val)
-
-            # Show positive tick labels only
-            ax.xaxis.set_major_formatter(
-                mticker.FuncFormatter(lambda x, _: f"{abs(int(x)):,}".replace(",", "."))
-            )
-
-            # Optional: youngest at bottom (classic pyramid look)
-            #ax.invert_yaxis()
-
-            fig.tight_layout()
-            return fig
-            """
+        with ui.navset_underline(id="pyr_tab"):
+            with ui.nav_panel("2022 nach Stadtteilen"):
+                # Rendered once as an HTML fragment (plotly.js is loaded once per page from
+                # /assets, see plotly_output.py), filter changes only patch the x arrays
+                @render.ui
+                @profiling.output
+                def alterspyramide():
+                    # prebuilt for the default and single-district views (warmup.py)
+                    with reactive.isolate():
+                        return ui.HTML(figures.pyramid(pyr_cube(), selected_districts()))
+
+                @reactive.effect
+                async def _update_pyramid():
+                    # Plotly.restyle on the client: only the changed x arrays go over the wire,
+                    # and nothing if the selection sums the same districts (or the cube has none)
+                    cube = pyr_cube()
+                    key = (cube.version, cube.selection_index(selected_districts()))
+                    if restyled.get("alterspyramide") == key:
+                        return
+                    restyled["alterspyramide"] = key
+                    d = agg_by_age()
+                    await plotly_output.restyle(
+                        "alterspyramide", {"x": [-d["Männer"].abs() / 1000, d["Frauen"] / 1000]}, ["Männer", "Frauen"]
+                    )
+
+            # Comparison / animation of all age tables in Input/ (city-wide, no Stadtteil split)
+            with ui.nav_panel("Jahresvergleich"):
+                with ui.layout_columns(fill=False):
+                    ui.input_checkbox_group(
+                        "pyr_years", "Jahre", [str(y) for y in pyramid_years.YEARS],
+                        selected=[str(y) for y in pyramid_years.YEARS], inline=True,
+                    )
+                    ui.input_radio_buttons(
+                        "pyr_mode", "Darstellung", {"overlay": "Überlagert", "animation": "Animation"},
+                        inline=True,
+                    )
+
+                @render.ui
+                @profiling.output
+                def pyramid_years_plot():
+                    # Figures are cached per (mode, years) in pyramid_years.figure_html
+                    year_tables()
+                    years = tuple(int(y) for y in input.pyr_years())
+                    return ui.HTML(pyramid_years.figure_html(input.pyr_mode(), years))
 
     # === REPLACED CARD: Combined Stadtteile and Lagekriterium ===
     with ui.card(style="height: 700px;"):
@@ -166,61 +123,30 @@ with ui.layout_columns(fill=False):
             ui.input_action_button("btn_schule", "Pkte_Schule Map")
             ui.input_action_button("btn_arzt", "Pkte_Arzt Map")
             ui.input_action_button("btn_opnv", "Pkte_Oepnv Map")
+        ui.input_select("map_metric", "Stadtteile einfärben nach", {"": "–", **district_metrics.METRICS}, selected="")
 
         # --- Interactive Map ---
         @render_widget
+        @profiling.output
 
         def lu_map():
-            df_st_local = df_st
+            from ipyleaflet import Map as IpylMap
+
+            geometry()
             map_center = [49.49, 8.4]
             m = IpylMap(center=map_center, zoom=12)
+            # Geometry, district IDs, popups and tooltips are prebuilt once per process
+            district_layer.new_layer(m)
+            return m
 
-            # Prepare GeoJSON data with enhanced popup content
-            geojson_data = df_st_local.__geo_interface__
-            # print(geojson_data)
-            # Define the district names and IDs from your example
-            district_info = {
-                "11": "Mitte",
-                "12": "Süd",
-                "13": "Nord",
-                "14": "West",
-                "15": "Friesenheim",
-                "21": "Oppau",
-                "22": "Edigheim",
-                "23": "Pfingstweide",
-                "31": "Oggersheim",
-                "35": "Ruchheim",
-                "41": "Maudach",
-                "51": "Mundenheim",
-                "52": "Rheingönheim",
-                "BASF": "BASF"
-            }
-
-            # Add popup content to each feature in the GeoJSON data
-            for feature in geojson_data['features']:
-                properties = feature.get('properties', {})
-
-                # Extract the specific fields
-                name = properties.get("MIFSTADTT6", "Unbekannter Stadtteil")
-                einwohner = properties.get("MIFSTADTT1", "k.A.")
-                flaeche = properties.get("MIFSTADTT3", "k.A.")
-
-                # Find district ID - FIXED: safer approach
-                district_id = None
-                for id, district_name in district_info.items():
-                    # Use the full district name for matching
-                    if district_name in name or name in district_name:
-                        district_id = id
-                        break
-                                # If no match found, try partial matching
-                if district_id is None:
-                    for id, district_name in district_info.items():
-                        # Extract main name part (before slash if exists)
-                        main_name = district_name.split('/')[0].split()[0] if '/' in district_name else district_name.split()[0]
-                        if main_name in name:
-                            district_id = id
-                            break
-
+        # Choropleth mode: the geometry stays on the client, a metric change sends one
+        # message with the class of every district (district_layer.restyle)
+        @reactive.effect
+        async def _restyle_districts():
+            metric = input.map_metric()
+            facility_points()
+            choropleth = district_metrics.choropleth(kos_cube(), metric) if metric else None
+            await district_layer.restyle(lu_map.widget, choropleth)
 
 
         # --- Reactive value for current map ---
@@ -257,60 +183,358 @@ with ui.layout_columns(fill=False):
             current_map.set("btn_opnv")
 
         # --- Render HTML map ---
+        # The layer is served from the cached /maps route (see asgi.py) instead of
+        # being inlined into the page on every click.
         @render.ui
+        @profiling.output
         def map_container():
             key = current_map()
-            # Add debug output to see what's happening
-            print(f"Loading map with key: {key}")
-            print(f"Available keys: {list(MAP_PATHS.keys())}")
-
             try:
-                file_path = MAP_PATHS[key]
-                print(f"Looking for file: {file_path}")
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    html_content = file.read()
-                return ui.HTML(html_content)
+                src = map_assets.url(key)
             except KeyError:
-                return ui.p(f"Key '{key}' not found in MAP_PATHS. Available keys: {list(MAP_PATHS.keys())}")
+                return ui.p(f"Key '{key}' not found in MAP_PATHS. Available keys: {list(map_assets.MAP_PATHS.keys())}")
             except FileNotFoundError:
-                return ui.p(f"File not found: {MAP_PATHS.get(key, 'Unknown key')}")
+                return ui.p(f"File not found: {map_assets.MAP_PATHS.get(key, 'Unknown key')}")
             except Exception as e:
                 return ui.p(f"Error loading map: {str(e)}")
+            return ui.tags.iframe(
+                src=src,
+                loading="lazy",
+                style="width: 100%; height: 100%; min-height: 500px; border: 0;",
+            )
 
 
 with ui.layout_columns(fill=False):
 
     with ui.card():
         ui.card_header("Bevölkerungsprognose")
-        ui.p("Graph here")
 
-        # === Reactive helpers ===
+        with ui.layout_columns(fill=False):
+            ui.input_slider("fc_tfr", "Kinder je Frau", 1.0, 2.2, forecast.Scenario().tfr, step=0.01)
+            ui.input_slider("fc_mortality", "Sterblichkeit (Faktor)", 0.7, 1.3, forecast.Scenario().mortality, step=0.05)
+            ui.input_slider("fc_migration", "Wanderungssaldo je 1.000 EW", -10.0, 15.0, forecast.Scenario().net_migration, step=0.5)
+            ui.input_select("fc_fan", "Unsicherheitsband (Monte Carlo)", ["aus", *forecast.SCENARIOS], selected="aus")
+
+        @reactive.calc
+        def custom_scenario():
+            return forecast.Scenario(
+                tfr=input.fc_tfr(), mortality=input.fc_mortality(), net_migration=input.fc_migration()
+            )
+
+        @reactive.calc
+        @profiling.calc
+        def forecast_lines():
+            # Projections are memoized per scenario in forecast.project, slider moves only
+            # recompute the custom scenario, the filter only re-sums districts
+            return figures.forecast_lines(pyr_cube(), selected_districts(), custom_scenario())
+
+        # 5/25/75/95 % quantiles around one scenario; the first run per scenario and
+        # selection simulates in a process pool, later runs come from the disk cache. It
+        # runs off the event loop, the plot keeps the deterministic lines until it is done
+        @reactive.extended_task
+        async def simulate_bands(cube, scenario, selection):
+            return await asyncio.to_thread(forecast_mc.fan_chart_for, cube, scenario, selection)
+
+        @reactive.effect
+        def _simulate_bands():
+            name = input.fc_fan()
+            cube = pyr_cube()
+            key = (cube.version, cube.selection_index(selected_districts()), name)
+            if restyled.get("forecast_bands") == key:
+                return
+            restyled["forecast_bands"] = key
+            if name in forecast.SCENARIOS:
+                simulate_bands.invoke(cube, forecast.SCENARIOS[name], selected_districts())
+            else:
+                simulate_bands.cancel()
+
         @reactive.calc
-        def filtered_rows():
-            #Filter by selected Stadtteile if the column exists; else return all rows.
-            d = df_pyr.copy()
-            if "Stadtteil" in d.columns:
-                sel = set(input.city_districts())
-                d = d[d["Stadtteil"].isin(sel)]
-            return d
+        @profiling.calc
+        def forecast_bands():
+            if input.fc_fan() not in forecast.SCENARIOS or simulate_bands.status() != "success":
+                return figures.NO_BANDS
+            q = simulate_bands.result()
+            return {label: q[i] / 1000 for label, i in figures.FAN_BANDS.items()}
+
+        @render.ui
+        @profiling.output
+        def forecast_plot():
+            with reactive.isolate():
+                return ui.HTML(figures.forecast_plot(pyr_cube(), selected_districts(), custom_scenario(), forecast_bands()))
+
+        @reactive.effect
+        async def _update_forecast():
+            # nothing to send if the selection sums the same districts (or the cube has none)
+            cube = pyr_cube()
+            key = (cube.version, cube.selection_index(selected_districts()), custom_scenario())
+            if restyled.get("forecast_plot") == key:
+                return
+            restyled["forecast_plot"] = key
+            lines = forecast_lines()
+            await plotly_output.restyle("forecast_plot", {"y": [y / 1000 for y in lines.values()]}, list(lines))
+
+        @reactive.effect
+        async def _update_forecast_bands():
+            bands = forecast_bands()
+            await plotly_output.restyle("forecast_plot", {"y": list(bands.values())}, list(bands))
 
+        # === Reactive helpers ===
         @reactive.calc
+        @profiling.calc
         def agg_by_age():
+            # Männer/Frauen by Alter across the selected Stadtteile: a sum over the cube's district axis.
+            # If the source has no 'Stadtteil', the selection is ignored (whole table).
+            # Shared across sessions (shared_cache.py); consumers copy before modifying.
+            return figures.age_table(pyr_cube(), selected_districts())
 
-            # Aggregate Männer/Frauen by Alter across the selected Stadtteile.
-            # If 'Stadtteil' doesn't exist, this just groups the whole table.
-
-            d = filtered_rows()
-            required = {"Alter", "Männer", "Frauen"}
-            missing = required - set(d.columns)
-            if missing:
-                # Graceful empty frame if columns are missing
-                return pd.DataFrame(columns=["Alter", "Männer", "Frauen"])
-            g = (
-                d.groupby("Alter", as_index=False)[["Männer", "Frauen"]]
-                .sum(numeric_only=True)
-                .sort_values("Alter")
-            )
-            # Clean NaNs
-            g[["Männer", "Frauen"]] = g[["Männer", "Frauen"]].fillna(0)
-            return g
\ No newline at end of file
+    with ui.card():
+        ui.card_header("Lagekriterium: Entfernung zur nächsten Einrichtung")
+
+        # Nearest-facility distances per 100 m cell (KD-trees in accessibility.py),
+        # averaged over residents of the selected Stadtteile
+        @render.ui
+        @profiling.output
+        def lage_table():
+            geometry(), facility_points()
+            table = accessibility.age_group_summary(kos_cube(), selected_districts())
+            if table.isna().all().all():
+                return ui.p(
+                    "Keine Standortdaten: Punktdateien unter Input/facilities/<kita|schule|arzt|oepnv>.geojson oder .csv ablegen."
+                )
+            labels = {k: layer.label for k, layer in facilities.LAYERS.items()}
+            reg = district_layer.registry()
+            ids = set(selected_district_ids())
+            districts = accessibility.district_summary()
+            districts = districts[districts.index.isin(ids)].rename(index=reg.names, columns=labels)
+            districts.index.name = "Stadtteil"
+            table = table.rename(columns=labels)
+            table.index.name = "Altersgruppe"
+            fmt = dict(na_rep="k.A.", float_format="{:,.0f} m".format, classes="table table-sm")
+            return ui.HTML(table.to_html(**fmt) + districts.to_html(**fmt))
+
+        # Offline GTFS reachability (transit.py), cached per departure-time window
+        @render.ui
+        @profiling.output
+        def oepnv_centre_table():
+            transit_feed()
+            if not transit.feed_available():
+                return ui.p(f"Kein GTFS-Feed unter {transit.FEED_PATH.name}: ÖPNV-Fahrzeiten nicht verfügbar.")
+            minutes = transit.district_minutes_to_centre(("07:00", "09:00"))
+            minutes = minutes[minutes.index.isin(set(selected_district_ids()))]
+            table = minutes.rename(index=district_layer.registry().names).to_frame("Minuten bis Mitte (ÖPNV, 7–9 Uhr)")
+            table.index.name = "Stadtteil"
+            return ui.HTML(table.to_html(na_rep="k.A.", float_format="{:.0f}".format, classes="table table-sm"))
+
+
+# === KPIs ===
+# All value boxes read from one memoized num_data.compute_kpis() result per selection
+
+with ui.layout_column_wrap(fill=False):
+    with ui.value_box(showcase=icon_svg("ruler-horizontal")):
+        "Wohnberechtigte Bevölkerung"
+
+        @render.text
+        @profiling.output
+        def population():
+            return num_data.num_population(bv())
+
+    with ui.value_box(showcase=icon_svg("ruler-horizontal")):
+        "Bevölkerung am Ort der Hauptwohnung"
+
+        @render.text
+        @profiling.output
+        def population_main():
+            return num_data.num_population_main_household(kos_cube(), selected_districts())
+
+    with ui.value_box(showcase=icon_svg("ruler-vertical")):
+        "Bevölkerung am Ort der Nebenwohnung"
+
+        @render.text
+        @profiling.output
+        def population_seconday():
+            return num_data.num_population_secondary_household(kos_cube(), selected_districts())
+
+with ui.layout_column_wrap(fill=False):
+    with ui.value_box(showcase=icon_svg("earlybirds")):
+        "Frauenanteil in %"
+
+        @render.text
+        @profiling.output
+        def population_female_percentage():
+            return num_data.per_population_female(kos_cube(), selected_districts())
+
+    with ui.value_box(showcase=icon_svg("ruler-horizontal")):
+        "Männeranteil in %"
+
+        @render.text
+        @profiling.output
+        def population_male_percentage():
+            return num_data.per_population_male(kos_cube(), selected_districts())
+
+    with ui.value_box(showcase=icon_svg("ruler-vertical")):
+        "Durchschnittsalter in Jahren"
+
+        @render.text
+        @profiling.output
+        def average_age():
+            return num_data.num_population_average_age(kos_cube(), selected_districts())
+
+# Facility KPIs from the shared per-district table in facilities.py (built on first use)
+@reactive.calc
+@profiling.calc
+def selected_district_ids():
+    geometry()
+    reg = district_layer.registry()
+    return [i for i in (reg.district_id(name) for name in selected_districts()) if i]
+
+
+with ui.layout_column_wrap(fill=False):
+    with ui.value_box(showcase=icon_svg("children")):
+        "Kitas"
+
+        @render.text
+        @profiling.output
+        def facilities_kita():
+            facility_points()
+            return facilities.kpi_text("kita", selected_district_ids())
+
+    with ui.value_box(showcase=icon_svg("school")):
+        "Schulen"
+
+        @render.text
+        @profiling.output
+        def facilities_schule():
+            facility_points()
+            return facilities.kpi_text("schule", selected_district_ids())
+
+    with ui.value_box(showcase=icon_svg("user-doctor")):
+        "Ärzte"
+
+        @render.text
+        @profiling.output
+        def facilities_arzt():
+            facility_points()
+            return facilities.kpi_text("arzt", selected_district_ids())
+
+    with ui.value_box(showcase=icon_svg("bus")):
+        "ÖPNV-Haltestellen"
+
+        @render.text
+        @profiling.output
+        def facilities_oepnv():
+            facility_points()
+            return facilities.kpi_text("oepnv", selected_district_ids())
+
+
+# === Pies ===
+# Rendered once per session from the microdata's frequency index (frequency_index.py);
+# a filter change only patches labels and values (see _update_pies)
+with ui.layout_columns(fill=False):
+    with ui.card():
+        ui.card_header("Familienstand")
+
+        @render.ui
+        @profiling.output
+        def family_pie():
+            with reactive.isolate():
+                return ui.HTML(figures.pie(kos_freq(), "Familienstand", selected_districts()))
+
+    with ui.card():
+        ui.card_header("Religionszugehörigkeit")
+
+        @render.ui
+        @profiling.output
+        def religion_pie():
+            with reactive.isolate():
+                return ui.HTML(figures.pie(kos_freq(), "Religion", selected_districts()))
+
+    with ui.card():
+        ui.card_header("Staatsangehörigkeit")
+
+        @render.ui
+        @profiling.output
+        def citizenship_pie():
+            with reactive.isolate():
+                return ui.HTML(figures.pie(kos_freq(), "Staatsangehörigkeit", selected_districts()))
+
+
+@reactive.effect
+async def _update_pies():
+    index, selection = kos_freq(), selected_districts()
+    for column, output_id in figures.PIE_OUTPUTS.items():
+        if column not in index.categories:
+            continue
+        labels, values = index.top(column, selection, figures.PIE_TOP_N)
+        await plotly_output.restyle(output_id, {"labels": [labels], "values": [values]})
+
+
+# === Elections ===
+# Precinct results summed over the selected Stadtteile (elections.py). The bars are
+# rendered once per election; filter and comparison changes only patch heights and labels
+ELECTIONS = {name: e.label for name, e in elections.catalog().items()}
+
+with ui.layout_columns(fill=False):
+    with ui.card():
+        with ui.card_header():
+            @render.text
+            def election_title():
+                return ELECTIONS.get(input.election(), "Wahlergebnisse") if ELECTIONS else "Wahlergebnisse"
+
+        if not ELECTIONS:
+            ui.p("Keine Wahldaten: Ergebnisse je Wahlbezirk unter Input/wahlen/<wahl>_<jahr>.csv ablegen.")
+        else:
+            with ui.layout_columns(fill=False):
+                ui.input_select("election", "Wahl", ELECTIONS, selected=list(ELECTIONS)[-1])
+                ui.input_select("election_compare", "Veränderung gegenüber", {"": "–", **ELECTIONS}, selected="")
+
+            @reactive.calc
+            def current_election():
+                election_files()
+                e = elections.catalog().get(input.election()) or elections.latest()
+                req(e is not None)
+                return e
+
+            @reactive.calc
+            def compare_election():
+                election_files()
+                name = input.election_compare()
+                return elections.catalog().get(name) if name and name != input.election() else None
+
+            @reactive.effect
+            def _update_election_choices():
+                # files added to or removed from Input/wahlen/ while the session is open
+                election_files()
+                choices = {name: e.label for name, e in elections.catalog().items()}
+                if not choices or choices == ELECTIONS:
+                    return
+                ELECTIONS.clear()
+                ELECTIONS.update(choices)
+                with reactive.isolate():
+                    current, compare = input.election(), input.election_compare()
+                ui.update_select("election", choices=choices,
+                                 selected=current if current in choices else list(choices)[-1])
+                ui.update_select("election_compare", choices={"": "–", **choices},
+                                 selected=compare if compare in choices else "")
+
+            @render.ui
+            @profiling.output
+            def election_bar():
+                e = current_election()
+                with reactive.isolate():
+                    return ui.HTML(figures.election(e, selected_district_ids(), compare_election()))
+
+            @render.text
+            @profiling.output
+            def election_turnout():
+                e = current_election()
+                if not e.has_districts:
+                    return "Stadtweites Ergebnis (keine Wahlbezirksdaten, der Stadtteilfilter wirkt nicht)"
+                turnout = e.result(selected_district_ids()).turnout
+                return "Wahlbeteiligung: k.A." if pd.isna(turnout) else f"Wahlbeteiligung: {turnout:.1f} %"
+
+            @reactive.effect
+            async def _update_election():
+                labels, shares, texts = figures.election_bars(
+                    current_election(), selected_district_ids(), compare_election()
+                )
+                await plotly_output.restyle("election_bar", {"x": [labels], "y": [shares], "text": [texts]})
@@ -0,0 +1,38 @@
+# shiny_mode: core
+# Entry point: `shiny run asgi.py` (or `uvicorn asgi:app`) from the dashboard directory.
+# Serves the express app plus the cached static routes it links to.
+# Several workers share one read-only copy of the data (see shared_data.py):
+#   python shared_data.py && DASHBOARD_SHARED_DATA=1 uvicorn asgi:app --workers 4
+import asyncio
+import contextlib
+import os
+from pathlib import Path
+
+from shiny.express import wrap_express_app
+from starlette.applications import Starlette
+from starlette.routing import Mount, Route
+
+import map_assets
+import profiling
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # prebuild the default views before the first session (DASHBOARD_WARMUP=0 skips it)
+    if os.environ.get("DASHBOARD_WARMUP", "1") != "0":
+        import warmup       # loads the datasets, not part of the import-time budget
+
+        await asyncio.to_thread(warmup.run)
+    yield
+
+
+app = Starlette(
+    lifespan=lifespan,
+    routes=[
+        Route("/maps/{key}", map_assets.serve_map),
+        Route("/assets/{name}", map_assets.serve_static),
+        Route("/assets/{version}/{name}", map_assets.serve_static),
+        Route("/metrics", profiling.serve_metrics),
+        Mount("/", app=profiling.count_payload(wrap_express_app(Path(__file__).parent / "app.py"))),
+    ]
+)
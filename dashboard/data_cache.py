@@ -0,0 +1,151 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+import pandas as pd
+
+# Columnar on-disk cache for the Input/ datasets.
+# On first load a source (xlsx, csv, geojson, shapefile) is parsed, coerced and written
+# as Feather (tables) or GeoParquet (geometries) under .cache/. Later starts memory-map
+# that file. The cache name contains a SHA-256 of the source bytes and the load options,
+# so a changed source is picked up without any manual invalidation.
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+INPUT_DIR = ROOT_DIR / "Input"
+CACHE_DIR = Path(os.environ.get("DASHBOARD_CACHE_DIR", ROOT_DIR / ".cache"))
+CACHE_FORMAT = 1   # bump when the cache layout changes
+
+SHAPEFILE_PARTS = (".shp", ".shx", ".dbf", ".prj", ".cpg")
+
+_fingerprints = {}     # (path, options) -> (stamps of its files, digest)
+
+
+def coerce_age_table(df):
+    # Coerce types defensively; an open top class like "85 und mehr" counts as 85
+    if "Alter" in df.columns:
+        df["Alter"] = pd.to_numeric(df["Alter"].astype(str).str.extract(r"^\s*(\d+)")[0], errors="coerce")
+    for col in ["Männer", "Frauen"]:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
+    return df
+
+
+def _source_files(path):
+    path = Path(path)
+    if path.suffix.lower() == ".shp":
+        return [p for p in (path.with_suffix(s) for s in SHAPEFILE_PARTS) if p.exists()]
+    return [path]
+
+
+def _stamps(path):
+    return tuple((p.name, st.st_mtime_ns, st.st_size) for p, st in ((p, p.stat()) for p in _source_files(path)))
+
+
+def fingerprint(path, **options):
+    """
+    Content hash of a source (all shapefile parts) plus the options it is loaded with.
+    The files are only hashed again when the mtime or size of one of them changed.
+    """
+    key = (str(path), json.dumps(options, sort_keys=True, default=str))
+    stamps = _stamps(path)
+    known = _fingerprints.get(key)
+    if known is not None and known[0] == stamps:
+        return known[1]
+    h = hashlib.sha256()
+    h.update(f"v{CACHE_FORMAT}".encode())
+    for p in _source_files(path):
+        h.update(p.suffix.lower().encode())
+        with open(p, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    h.update(key[1].encode())
+    digest = h.hexdigest()[:20]
+    _fingerprints[key] = (stamps, digest)
+    return digest
+
+
+def fingerprints(paths):
+    """Combined fingerprint of several sources (e.g. all files of a directory)."""
+    h = hashlib.sha256()
+    for path in sorted(Path(p) for p in paths):
+        h.update(f"{path.name}:{fingerprint(path)};".encode())
+    return h.hexdigest()[:20]
+
+
+def _cache_path(path, digest, suffix):
+    return CACHE_DIR / f"{Path(path).stem}-{digest}{suffix}"
+
+
+def _store(write, target):
+    # write to a temp name first, so concurrent workers never map a half-written file
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+    try:
+        write(tmp)
+        os.replace(tmp, target)
+    except (OSError, ValueError, TypeError) as e:  # incl. pyarrow conversion errors
+        logger.warning("Could not write cache %s: %s", target, e)
+        tmp.unlink(missing_ok=True)
+
+
+def _load_table(path, parse, coerce, options):
+    digest = fingerprint(path, **options)
+    cached = _cache_path(path, digest, ".feather")
+    if cached.exists():
+        from pyarrow import feather
+        return feather.read_feather(cached, memory_map=True)
+
+    df = parse()
+    if coerce is not None:
+        df = coerce(df)
+    df = df.reset_index(drop=True)
+    _store(lambda p: df.to_feather(p), cached)
+    return df
+
+
+def _coerce_key(coerce):
+    # name plus bytecode hash, so editing a coerce function invalidates its cache entries
+    if coerce is None:
+        return None
+    code = getattr(coerce, "__code__", None)
+    digest = hashlib.sha1(code.co_code + repr(code.co_consts).encode()).hexdigest()[:8] if code else ""
+    return f"{getattr(coerce, '__name__', 'coerce')}:{digest}"
+
+
+def read_excel(path, coerce=None, **kwargs):
+    """pd.read_excel through the cache. coerce(df) -> df runs before the frame is stored."""
+    options = {"reader": "excel", "coerce": _coerce_key(coerce), **kwargs}
+    return _load_table(path, lambda: pd.read_excel(path, **kwargs), coerce, options)
+
+
+def read_csv(path, coerce=None, **kwargs):
+    """pd.read_csv through the cache. coerce(df) -> df runs before the frame is stored."""
+    options = {"reader": "csv", "coerce": _coerce_key(coerce), **kwargs}
+    return _load_table(path, lambda: pd.read_csv(path, **kwargs), coerce, options)
+
+
+def read_geo(path, crs=None, to_crs=None, parse=None):
+    """
+    gpd.read_file through a GeoParquet cache.
+    crs: CRS to assume for the source, to_crs: CRS the cached frame is stored in.
+    parse(path) -> GeoDataFrame replaces gpd.read_file for sources it cannot open.
+    """
+    import geopandas as gpd
+
+    options = {"parse": _coerce_key(parse)} if parse is not None else {}
+    digest = fingerprint(path, reader="geo", crs=crs, to_crs=to_crs, **options)
+    cached = _cache_path(path, digest, ".parquet")
+    if cached.exists():
+        return gpd.read_parquet(cached)
+
+    gdf = parse(path) if parse is not None else gpd.read_file(path)
+    if crs is not None:
+        gdf = gdf.set_crs(crs, allow_override=True)
+    if to_crs is not None:
+        gdf = gdf.to_crs(to_crs)
+    _store(lambda p: gdf.to_parquet(p), cached)
+    return gdf
@@ -0,0 +1,171 @@
+import os
+import sys
+import threading
+import time
+
+import datasets
+
+# Live reload of every source the app reads: datasets.SOURCES (Input/*, data/k5000.csv)
+# and the DERIVED groups (district geometry, Input/facilities/ and the Pkte_* maps,
+# Input/wahlen/, the yearly age tables, the GTFS feed).
+# A daemon thread polls size and mtime of the source files every WATCH_SECS. A source
+# is only reloaded after its files kept the same stamps for two polls, so a copy in
+# progress is never parsed. If the content hash differs from the one taken when the
+# source was loaded (datasets.loaded), only that source and the cubes built from it are
+# re-ingested, or the caches of the group are reset (datasets.reload). Their
+# shared_cache entries are dropped, and the warm-up runs again for the default views.
+# Sessions read the datasets through live(). After a reload the thread pushes the
+# published versions into one process-level reactive value on the event loop of the
+# sessions (publish()); nothing polls per session. Only the outputs reading a replaced
+# source are invalidated, filters and the other outputs keep their state.
+
+WATCH_SECS = float(os.environ.get("DASHBOARD_WATCH_SECS", "2"))    # 0 disables the watcher
+
+reloads = 0              # successful reloads, exported on /metrics
+_lock = threading.Lock()
+_thread = None
+_checked = {}            # name -> stamps of the files when their content was last compared
+_pending = {}            # name -> stamps seen on the last poll, not yet stable
+_published = None        # reactive.Value of datasets.versions, created by the first session
+_loop = None             # event loop of the sessions, publish() schedules onto it
+
+
+def _stamp(paths):
+    stamps = []
+    for path in paths:
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            continue
+        stamps.append((str(path), st.st_mtime_ns, st.st_size))
+    return tuple(stamps)
+
+
+def changed():
+    """Names of sources whose content changed and whose files are stable since the last poll."""
+    names = []
+    for name in [*datasets.SOURCES, *datasets.DERIVED]:
+        stamp = _stamp(datasets.source_files(name))
+        if (name in datasets.SOURCES and not stamp) or stamp == _checked.get(name):
+            # missing (e.g. being replaced) or unchanged: keep serving the loaded data
+            _pending.pop(name, None)
+            continue
+        if _pending.get(name) != stamp:
+            _pending[name] = stamp           # still being written, check again next poll
+            continue
+        del _pending[name]
+        _checked[name] = stamp
+        if datasets.fingerprint(name) != datasets.loaded.get(name):   # a touch without new content is no reload
+            names.append(name)
+    return names
+
+
+def reload(names):
+    global reloads
+    start = time.perf_counter()
+    try:
+        datasets.reload(names)
+    except Exception as e:  # noqa: BLE001 - a broken extract must not stop the watcher
+        print(f"reload of {', '.join(names)} failed, keeping the loaded data: {e}", file=sys.stderr, flush=True)
+        return False
+    reloads += 1
+    print(f"reloaded {', '.join(names)} in {time.perf_counter() - start:.2f} s", file=sys.stderr, flush=True)
+
+    import warmup
+
+    if warmup.last_seconds is not None:      # only if the process was warmed up at start
+        warmup.run()
+    publish()
+    return True
+
+
+def publish():
+    """Pushes datasets.versions into the sessions of this process (safe from any thread)."""
+    loop = _loop
+    if loop is None or loop.is_closed():
+        return                               # no session yet: they read the versions when they start
+    import asyncio
+
+    from shiny import reactive
+
+    async def push():
+        async with reactive.lock():
+            _sync()
+            await reactive.flush()
+
+    loop.call_soon_threadsafe(lambda: asyncio.ensure_future(push()))
+
+
+def _sync():
+    from shiny import reactive
+
+    with reactive.isolate():
+        if _published() != datasets.versions:
+            _published.set(dict(datasets.versions))
+
+
+def _watch():
+    while True:
+        time.sleep(WATCH_SECS)
+        names = changed()
+        if names:
+            reload(names)
+
+
+def start():
+    """Starts the watcher thread once per process (app.py calls this for every session)."""
+    global _thread
+    if WATCH_SECS <= 0:
+        return
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_watch, name="data-watcher", daemon=True)
+            _thread.start()
+
+
+def live(*names):
+    """
+    Reactive accessors for datasets.<name> inside a session, one calc per name. A calc
+    is invalidated only when its own dataset was republished (publish()). For a DERIVED
+    group the calc returns its version: outputs call it to be invalidated when the group
+    was reset.
+    """
+    import asyncio
+
+    from shiny import reactive
+
+    global _published, _loop
+
+    def current(name):
+        return datasets.versions[name] if name in datasets.DERIVED else getattr(datasets, name)
+
+    if WATCH_SECS <= 0:
+        # nothing is reloaded: the data of the session start, as plain accessors
+        return tuple((lambda value=current(name): value) for name in names)
+
+    with _lock:
+        if _published is None:
+            _published = reactive.Value(dict(datasets.versions))
+        if _loop is None:
+            try:
+                _loop = asyncio.get_running_loop()
+            except RuntimeError:
+                pass                         # express evaluates app.py once for the UI, outside the loop
+    _sync()                                  # datasets.refresh() of this session may have mapped a new generation
+    shown = {name: reactive.Value(datasets.versions[name]) for name in names}
+
+    @reactive.effect
+    def _forward():
+        published = _published()
+        for name in names:
+            shown[name].set(published[name])    # an unchanged version invalidates nothing
+
+    def accessor(name):
+        @reactive.calc
+        def value():
+            shown[name]()
+            return current(name)
+
+        return value
+
+    return tuple(accessor(name) for name in names)
@@ -0,0 +1,212 @@
+import os
+
+import data_cache
+import elections
+import facilities
+import frequency_index
+import geometry_store
+import microdata
+import num_data
+import population_cube
+import pyramid_years
+import shared_cache
+import shared_data
+import transit
+
+# Shared datasets, loaded once per process through the columnar cache (data_cache.py).
+# app.py is re-executed for every session and reads the frames from here; changed
+# sources are re-ingested one by one by data_watcher.py (reload()). Sources that other
+# modules load on first use (DERIVED: geometry, facilities, elections, year tables, the
+# GTFS feed) are
+# watched too; a change drops those modules' caches and bumps versions[group].
+
+INPUT_DIR = data_cache.INPUT_DIR
+DATA_DIR = data_cache.ROOT_DIR / "data"
+coerce_age_table = data_cache.coerce_age_table
+
+
+# Sidebar filter; warmup.py prebuilds the views for all of them and for each single one
+STADTTEILE = [
+    "Mitte", "Süd", "Nord/Hemshof", "West", "Friesenheim",
+    "Gartenstadt", "Maudach", "Mundenheim", "Oggersheim",
+    "Oppau", "Edigheim", "Pfingstweide", "Rheingönheim", "Ruchheim",
+]
+
+# === Load population data ===
+SOURCES = {
+    "df_pyr": INPUT_DIR / "2022.xlsx",
+    "bv": INPUT_DIR / "bevoelkerung.csv",
+    "wa": INPUT_DIR / "wahlen.csv",
+    "kos": DATA_DIR / "k5000.csv",
+}
+# sources kept as frames
+_READERS = {
+    "df_pyr": lambda path: data_cache.read_excel(path, coerce=coerce_age_table),
+    "bv": data_cache.read_csv,
+    "wa": data_cache.read_csv,
+}
+# derived aggregate -> (source it is built from, builder). Builders of sources without
+# a reader get the path: the microdata is streamed into its cube and never held as a
+# frame (microdata.py)
+CUBES = {
+    "pyr_cube": ("df_pyr", population_cube.from_table),
+    "kos_cube": ("kos", microdata.load_cube),
+    "kos_freq": ("kos", microdata.load_frequencies),
+}
+
+
+def _reset_geometry():
+    import accessibility
+    import district_geometry
+    import district_layer
+
+    for name in _LAZY:
+        globals().pop(name, None)
+    for module in (geometry_store, district_geometry, district_layer, facilities, accessibility, transit):
+        module.reset()
+    shared_cache.invalidate(output_id="district_metrics")
+
+
+def _reset_facilities():
+    import accessibility
+
+    facilities.reset()
+    accessibility.reset()
+    shared_cache.invalidate(output_id="district_metrics")
+
+
+# source group read by other modules -> (files(), reset()). files() lists the files that
+# exist now (directories can gain or lose files); reset() drops what was built from them.
+# The election catalog checks its sources itself, its reset only rebuilds it ahead of use.
+DERIVED = {
+    "geometry": (lambda: [p for p in [geometry_store.SOURCE_PATH] if p.exists()], _reset_geometry),
+    "facilities": (facilities.sources, _reset_facilities),
+    "pyramid_years": (pyramid_years.sources, pyramid_years.reset),
+    "elections": (elections.sources, elections.catalog),
+    "transit": (lambda: [p for p in [transit.FEED_PATH] if p.exists()], transit.reset),
+}
+
+# Serving mode for several workers: map a prepared read-only generation (shared_data.py)
+# instead of loading the sources in every worker
+SHARED = os.environ.get("DASHBOARD_SHARED_DATA", "0") == "1"
+
+df_pyr = bv = wa = None
+pyr_cube = None      # pre-aggregated cube (Stadtteil × Alter × Geschlecht × Wohnsitzart)
+kos_cube = None      # same cube folded from the microdata (one row per resident)
+kos_freq = None      # frequency index of its categorical columns (pies)
+generation = None    # mapped shared_data.Generation in serving mode
+# name -> number of times it was (re)published; sessions poll these (data_watcher.live)
+versions = dict.fromkeys([*_READERS, *CUBES, *DERIVED], 0)
+# source or DERIVED group -> fingerprint of its files taken before they were (re)loaded;
+# data_watcher compares against these, so an edit made before it starts is not missed
+loaded = {}
+
+
+def source_files(name):
+    """Files of a SOURCES entry or a DERIVED group."""
+    return [SOURCES[name]] if name in SOURCES else DERIVED[name][0]()
+
+
+def fingerprint(name):
+    """Content fingerprint of the files of a source or group that exist now."""
+    return data_cache.fingerprints(p for p in source_files(name) if p.exists())
+
+
+def _record(names):
+    for name in names:
+        loaded[name] = fingerprint(name)
+
+
+def load_sources(names=None):
+    """Returns (tables, cubes) parsed from SOURCES (or only names) through the columnar cache."""
+    names = list(SOURCES) if names is None else names
+    _record(names)
+    tables = {name: _READERS[name](SOURCES[name]) for name in names if name in _READERS}
+    cubes = {
+        name: build(tables[source] if source in tables else SOURCES[source])
+        for name, (source, build) in CUBES.items() if source in names
+    }
+    return tables, cubes
+
+
+def _publish(tables, cubes):
+    """Swaps in the given frames and cubes; the others stay as they are."""
+    for name, value in {**tables, **cubes}.items():
+        old = globals()[name]
+        globals()[name] = value
+        versions[name] += 1      # after the swap, so a poll never sees the old object
+        # drop the shared results of the replaced data
+        if isinstance(old, (population_cube.PopulationCube, frequency_index.FrequencyIndex)):
+            shared_cache.invalidate(old.version)
+        elif old is not None:
+            num_data.forget(old)
+
+
+def refresh(names=None):
+    """
+    Serving mode: maps the current shared generation if it changed since the last call
+    (app.py calls this for every new session). names limits the swap to the sources
+    known to have changed (and their cubes). Returns True if the data was swapped.
+    """
+    global generation
+    if not SHARED:
+        return False
+    name = shared_data.current_name()
+    if name is None or (generation is not None and name == generation.name):
+        return False
+    gen = shared_data.open_generation(name)
+    tables, cubes = gen.tables, gen.cubes
+    if names is not None and generation is not None:
+        tables = {t: tables[t] for t in names if t in tables}
+        cubes = {c: cubes[c] for c, (source, _) in CUBES.items() if source in names}
+    _publish(tables, cubes)
+    generation = gen
+    return True
+
+
+def reload(names):
+    """
+    Re-ingests only the changed sources (names) and the cubes built from them
+    (data_watcher.py calls this). In serving mode the new generation reuses the
+    unchanged tables of the current one. DERIVED groups in names are reset and
+    republished in this process.
+    """
+    for name in [n for n in names if n in DERIVED]:
+        _record([name])
+        DERIVED[name][1]()
+        versions[name] += 1
+    names = [n for n in names if n in SOURCES]
+    if not names:
+        return
+    tables, cubes = load_sources(names)
+    if not SHARED:
+        _publish(tables, cubes)
+        return
+    current = ({t: globals()[t] for t in _READERS}, {c: globals()[c] for c in CUBES})
+    shared_data.prepare(SOURCES, lambda: ({**current[0], **tables}, {**current[1], **cubes}))
+    refresh(names)
+
+
+_record(DERIVED)
+if SHARED:
+    _record(SOURCES)
+    if shared_data.current_name() is None:
+        shared_data.prepare(SOURCES, load_sources)
+    refresh()
+else:
+    _publish(*load_sources())
+
+
+# Frames that need heavy libraries are loaded on first attribute access (PEP 562)
+_LAZY = {
+    # WGS84 for leaflet, UTM32 for area/distance math (reprojected once, see geometry_store.py)
+    "df_st": lambda: geometry_store.districts().wgs84,
+    "df_st_utm": lambda: geometry_store.districts().utm,
+}
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        value = globals()[name] = _LAZY[name]()
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
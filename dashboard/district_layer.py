@@ -0,0 +1,305 @@
+import copy
+import threading
+import weakref
+
+import district_geometry
+import facilities
+
+# Process-wide registry for the district map layer.
+# app.py is re-executed for every session, so everything that only depends on the
+# geometry (ID index, popup/tooltip HTML, per-band layer data) is built once here and
+# sessions only create a thin GeoJSON widget around the prebuilt payload.
+# The choropleth fill is not a widget trait: one custom message carries the class of
+# every district plus the breaks, and the handler in CLIENT_JS lays the fill over the
+# feature style of the Leaflet layer already on the page (setStyle) and redraws the
+# legend, as plotly_output.py does with Plotly.restyle.
+
+ID_COL = "MIFSTADTT4"
+NAME_COL = "MIFSTADTT6"
+POPULATION_COL = "MIFSTADTT1"
+AREA_COL = "MIFSTADTT3"
+LAYER_NAME = "stadtteile"      # feature property the client finds the layer by
+MESSAGE = "district_choropleth"
+
+# in every feature's properties: ipyleaflet only merges a layer-level style on the
+# server, into a deep copy of the data that is sent again on every change
+LAYER_STYLE = {
+    "color": "#900",           # Stroke color
+    "weight": 1,               # Stroke width
+    "opacity": 1,              # Stroke opacity
+    "fillColor": "#DE04D3",    # Fill color
+    "fillOpacity": 0.1,        # Fill opacity
+}
+CHOROPLETH_OPACITY = 0.7
+HOVER_STYLE = {
+    "color": "white",          # Hover stroke color
+    "weight": 3,               # Hover stroke width
+    "fillColor": "#ff5444",    # Hover fill color (lighter red)
+    "fillOpacity": 0.9,        # Hover fill opacity
+}
+
+POPUP_TEMPLATE = """
+<div style='padding: 10px; min-width: 250px;'>
+    <h4 style='margin: 0 0 10px 0; color: #2c3e50;'>{name}</h4>
+    <div style='border-top: 1px solid #eee; padding-top: 8px;'>
+        <p style='margin: 5px 0;'><b>ID:</b> {district_id}</p>
+        <p style='margin: 5px 0;'><b>Einwohner:</b> {einwohner}</p>
+        <p style='margin: 5px 0;'><b>Fläche:</b> {flaeche} ha</p>
+    </div>
+</div>
+"""
+
+# Registered once per page (app.py, before ipyleaflet loads). Leaflet publishes itself
+# as window.L; an init hook on L.GeoJSON keeps the district layers, and the last
+# message is applied again to a layer added later (map re-render, new zoom band data
+# goes through the same style function). resetStyle after a hover uses it as well.
+CLIENT_JS = """
+(function () {
+  var layers = [], state = null;
+
+  function fmt(value, digits) {
+    return value.toLocaleString("de-DE", {minimumFractionDigits: digits, maximumFractionDigits: digits});
+  }
+
+  function legend(g) {
+    var map = g._map;
+    if (!map) return;
+    if (!map._districtLegend) {
+      var control = L.control({position: "bottomright"});
+      control.onAdd = function () { return L.DomUtil.create("div", "district-legend"); };
+      control.addTo(map);
+      map._districtLegend = control;
+    }
+    var el = map._districtLegend.getContainer();
+    el.style.cssText = "background: white; padding: 6px 8px; font-size: 12px;";
+    if (!state) { el.style.display = "none"; return; }
+    var b = state.breaks, rows = "";
+    state.colors.forEach(function (color, i) {
+      var label = b.length === 1 ? fmt(b[0], state.digits) : fmt(b[i], state.digits) + " – " + fmt(b[i + 1], state.digits);
+      rows += "<div><span style='display: inline-block; width: 12px; height: 12px; background: " + color +
+              "; margin-right: 6px;'></span>" + label + "</div>";
+    });
+    el.innerHTML = "<b>" + state.title + "</b>" + rows;
+    el.style.display = "";
+  }
+
+  function apply(g) {
+    if (!g._districtBase) g._districtBase = g.options.style;
+    var base = g._districtBase, fills = {};
+    if (state) {
+      state.ids.forEach(function (id, i) {
+        var c = state.classes[i];
+        fills[id] = {fillColor: c < 0 ? state.no_data : state.colors[c], fillOpacity: state.opacity};
+      });
+    }
+    g.options.style = function (f) { return Object.assign({}, base(f), fills[f.id] || {}); };
+    g.setStyle(g.options.style);
+    legend(g);
+  }
+
+  function install(leaflet) {
+    if (!leaflet || !leaflet.GeoJSON || leaflet.GeoJSON._districtHook) return;
+    leaflet.GeoJSON._districtHook = true;
+    leaflet.GeoJSON.addInitHook(function () {
+      var g = this;
+      var mine = g.getLayers().some(function (l) {
+        return l.feature && l.feature.properties && l.feature.properties.layer === "%(name)s";
+      });
+      if (!mine) return;
+      layers.push(g);
+      g.on("add", function () { apply(g); });
+    });
+  }
+
+  var current = window.L;
+  install(current);
+  Object.defineProperty(window, "L", {
+    configurable: true,
+    get: function () { return current; },
+    set: function (value) { current = value; install(value); }
+  });
+
+  document.addEventListener("DOMContentLoaded", function () {
+    Shiny.addCustomMessageHandler("%(message)s", function (msg) {
+      state = msg.classes ? msg : null;
+      layers = layers.filter(function (g) { return g._map; });
+      layers.forEach(apply);
+    });
+  });
+})();
+""" % {"name": LAYER_NAME, "message": MESSAGE}
+
+_registry = None
+_lock = threading.Lock()
+_views = weakref.WeakKeyDictionary()     # map widget -> DistrictLayer
+
+
+class DistrictRegistry:
+    """
+    ids: district IDs in feature order
+    names: ID -> Stadtteil name
+    name_index: name (and short alias, e.g. "Nord" for "Nord/Hemshof") -> ID
+    levels: zoom band -> GeoJSON with feature ids, popup, tooltip and style prebuilt
+    """
+
+    def __init__(self, levels, ids, names, name_index):
+        self.levels = levels
+        self.ids = ids
+        self.names = names
+        self.name_index = name_index
+
+    def district_id(self, name):
+        return self.name_index.get(name) or self.name_index.get(name.split("/")[0].strip())
+
+
+def _build():
+    levels, ids, names, name_index = {}, [], {}, {}
+    for band, _, _, _ in district_geometry.ZOOM_BANDS:
+        data = copy.deepcopy(district_geometry.load_level(band))
+        for feature in data["features"]:
+            props = feature["properties"]
+            district_id = str(props.get(ID_COL) or "")
+            name = props.get(NAME_COL) or "Unbekannter Stadtteil"
+            feature["id"] = district_id
+            props["popup"] = POPUP_TEMPLATE.format(
+                name=name,
+                district_id=district_id or "N/A",
+                einwohner=props.get(POPULATION_COL, "k.A."),
+                flaeche=props.get(AREA_COL, "k.A."),
+            )
+            props["tooltip"] = f"{district_id} {name}" if district_id else name
+            props["style"] = LAYER_STYLE
+            props["layer"] = LAYER_NAME
+            if band == district_geometry.ZOOM_BANDS[0][0] and district_id:
+                ids.append(district_id)
+                names[district_id] = name
+                name_index[name] = district_id
+        levels[band] = data
+    return DistrictRegistry(levels, ids, names, name_index)
+
+
+def registry():
+    global _registry
+    if _registry is None:
+        with _lock:
+            if _registry is None:
+                _registry = _build()
+    return _registry
+
+
+def reset():
+    """Drops the registry (the district geometry changed); maps built later use the new one."""
+    global _registry
+    with _lock:
+        _registry = None
+
+
+def head():
+    """Head tag of the page: the choropleth handler (must load before ipyleaflet)."""
+    from shiny import ui
+
+    return ui.tags.script(CLIENT_JS)
+
+
+class DistrictLayer:
+    """
+    District layer of one map: one GeoJSON layer with the prebuilt features of the
+    current zoom band. The geometry goes to the client once per zoom band; a
+    choropleth is one custom message (choropleth_message / restyle).
+    """
+
+    def __init__(self, m):
+        from ipyleaflet import GeoJSON, WidgetControl
+        from ipywidgets import HTML
+
+        self.band = district_geometry.band_for_zoom(m.zoom)
+        self.info = HTML()
+        self.choropleth = None
+        self._sent = None
+        # no layer style: ipyleaflet sends the shared data as is (see LAYER_STYLE)
+        self.layer = GeoJSON(data=registry().levels[self.band], hover_style=HOVER_STYLE)
+        self.layer.on_hover(self._on_hover)
+        self.layer.on_click(self._on_click)
+
+        m.add(WidgetControl(widget=self.info, position="topright"))
+        m.observe(self._on_zoom, names="zoom")
+        m.add(self.layer)
+
+    def _value_text(self, district_id):
+        c = self.choropleth
+        return "" if c is None else f"<br><b>{c.title}:</b> {c.text(district_id)}"
+
+    def _on_hover(self, feature, **kwargs):
+        self.info.value = feature["properties"]["tooltip"] + self._value_text(feature.get("id", ""))
+
+    def _on_click(self, feature, **kwargs):
+        # facility counts/scores come from the shared table in facilities.py
+        district_id = feature.get("id", "")
+        self.info.value = (feature["properties"]["popup"] + self._value_text(district_id)
+                           + facilities.popup_html(district_id))
+
+    def _on_zoom(self, change):
+        band = district_geometry.band_for_zoom(change["new"])
+        if band != self.band:
+            self.band = band
+            self.layer.data = registry().levels[band]
+
+    def choropleth_message(self, choropleth=None):
+        """
+        Message for the client handler coloring the districts by a district_metrics.Choropleth
+        (None = fixed style), or None if the client already shows it.
+        """
+        self.choropleth = choropleth
+        if choropleth is None:
+            msg = {"classes": None}
+        else:
+            ids = list(registry().ids)
+            msg = {
+                "ids": ids,
+                "classes": [int(choropleth.classes.get(i, -1)) for i in ids],
+                "colors": list(choropleth.palette),
+                "breaks": [float(b) for b in choropleth.breaks],
+                "no_data": choropleth.no_data,
+                "opacity": CHOROPLETH_OPACITY,
+                "title": choropleth.title,
+                "digits": choropleth.digits,
+            }
+        if msg == self._sent:
+            return None
+        self._sent = msg
+        return msg
+
+
+def new_layer(m):
+    """
+    Adds a district layer plus an info box to the map and returns it (DistrictLayer).
+    The layer follows the map zoom through the prebuilt simplification levels.
+    """
+    view = DistrictLayer(m)
+    _views[m] = view
+    return view
+
+
+def layer_of(m):
+    """DistrictLayer of a map created by new_layer, or None."""
+    return _views.get(m)
+
+
+async def restyle(m, choropleth=None, session=None):
+    """Colors the districts of the map m on the client of the session (see CLIENT_JS)."""
+    layer = layer_of(m) if m is not None else None
+    if layer is None:
+        return
+    msg = layer.choropleth_message(choropleth)
+    if msg is None:
+        return
+    if session is None:
+        from shiny.session import get_current_session
+
+        session = get_current_session()
+    if session is not None:
+        await session.send_custom_message(MESSAGE, msg)
+
+
+# built at import, i.e. once per process before the first session
+registry()
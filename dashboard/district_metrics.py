@@ -0,0 +1,147 @@
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+import district_layer
+import facilities
+import forecast
+import shared_cache
+
+# Per-district metrics for the choropleth mode of the district map (district_layer.py).
+# All metrics of a population cube are computed together, classed into quantile breaks
+# and turned into one class per district ID, once per cube version (shared_cache),
+# so switching the metric on the map is a dictionary lookup plus one small message
+# (district_layer.restyle).
+
+N_CLASSES = 5
+PALETTE = ("#ffffb2", "#fecc5c", "#fd8d3c", "#f03b20", "#bd0026")   # YlOrRd
+NO_DATA_COLOR = "#bbbbbb"
+FORECAST_YEARS = 20
+
+METRICS = {
+    "einwohner": "Einwohner",
+    "durchschnittsalter": "Durchschnittsalter",
+    "frauenanteil": "Frauenanteil",
+    "einrichtungsdichte": "Einrichtungsdichte",
+    "prognose": f"Bevölkerungsentwicklung bis {forecast.BASE_YEAR + FORECAST_YEARS}",
+}
+
+
+class Choropleth(NamedTuple):
+    title: str                  # legend title incl. unit
+    values: dict                # district ID -> value (NaN without data)
+    classes: dict               # district ID -> class (0 = lowest, -1 = no data)
+    palette: list               # fill color per class
+    breaks: list                # class limits: lowest value, inner breaks, highest value
+    no_data: str                # fill color of class -1
+    digits: int                 # decimals of the value labels
+
+    def text(self, district_id):
+        return _fmt(self.values.get(district_id, np.nan), self.digits)
+
+
+def _fmt(value, digits):
+    return "k.A." if pd.isna(value) else f"{value:,.{digits}f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+def quantile_breaks(values, n_classes=N_CLASSES):
+    """Class limits (lowest value, inner breaks, highest value) of the finite values."""
+    v = np.asarray(values, dtype=float)
+    v = v[np.isfinite(v)]
+    if not len(v):
+        return np.array([])
+    return np.unique(np.quantile(v, np.linspace(0, 1, n_classes + 1)))
+
+
+def classify(values, breaks):
+    """Class of every value (0 = lowest, -1 = no data)."""
+    v = np.asarray(values, dtype=float)
+    classes = np.searchsorted(breaks[1:-1], v, side="right")
+    return np.where(np.isfinite(v), classes, -1)
+
+
+def _palette(n):
+    # spread fewer classes over the whole ramp
+    return [PALETTE[int(round(i))] for i in np.linspace(0, len(PALETTE) - 1, n)] if n > 1 else [PALETTE[-1]] * n
+
+
+def _cube_metrics(cube, ids):
+    reg = district_layer.registry()
+    rows = {reg.district_id(name): i for i, name in enumerate(cube.districts)} if cube.has_districts else {}
+    out = pd.DataFrame(np.nan, index=ids, columns=["durchschnittsalter", "frauenanteil", "prognose"])
+    if not rows:
+        return out
+    ages = cube.ages
+    by_age = cube.counts[:, :-1].sum(axis=(2, 3))
+    by_sex = cube.counts.sum(axis=(1, 3))
+    total = cube.counts.sum(axis=(1, 2, 3)).astype(float)
+    n_aged = by_age.sum(axis=1)
+    projected = forecast.project(forecast.base_population(cube), forecast.Scenario(), FORECAST_YEARS,
+                                 key=(cube.version, "base")).sum(axis=(2, 3))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        values = {
+            "durchschnittsalter": np.where(n_aged > 0, by_age @ ages / n_aged, np.nan),
+            "frauenanteil": np.where(total > 0, by_sex[:, 1] / total * 100, np.nan),
+            "prognose": np.where(projected[0] > 0, projected[-1] / projected[0] * 100 - 100, np.nan),
+        }
+    for district_id, row in rows.items():
+        if district_id in out.index:
+            out.loc[district_id] = [values[col][row] for col in out.columns]
+    return out
+
+
+def _facility_density(ids):
+    """(title, values, digits): facilities per 1.000 residents, or the mean location score without point data."""
+    table = facilities.district_table().reindex(ids)
+    counts = table[list(facilities.LAYERS)]
+    if counts.notna().any().any():
+        residents = table["einwohner"].where(table["einwohner"] > 0)
+        return "Einrichtungen je 1.000 EW", counts.sum(axis=1, min_count=1) / residents * 1000, 2
+    return "Lagepunkte Einrichtungen (Ø)", table[[f"{key}_punkte" for key in facilities.LAYERS]].mean(axis=1), 2
+
+
+def _build(cube):
+    reg = district_layer.registry()
+    ids = list(reg.ids)
+    table = _cube_metrics(cube, ids)
+    # official residents of the district layer: the microdata is a sample and only
+    # good for shares and means
+    props = {f["id"]: f["properties"] for f in reg.levels[next(iter(reg.levels))]["features"]}
+    table["einwohner"] = pd.to_numeric(
+        pd.Series({i: props[i].get(district_layer.POPULATION_COL) for i in ids}), errors="coerce")
+    density_title, table["einrichtungsdichte"], density_digits = _facility_density(ids)
+
+    titles = {
+        "einwohner": ("Einwohner", 0),
+        "durchschnittsalter": ("Durchschnittsalter (Jahre)", 1),
+        "frauenanteil": ("Frauenanteil (%)", 1),
+        "einrichtungsdichte": (density_title, density_digits),
+        "prognose": (f"Entwicklung {forecast.BASE_YEAR}–{forecast.BASE_YEAR + FORECAST_YEARS} (%)", 1),
+    }
+    result = {}
+    for metric in METRICS:
+        title, digits = titles[metric]
+        values = table[metric].to_numpy(dtype=float)
+        breaks = quantile_breaks(values)
+        classes = classify(values, breaks)
+        result[metric] = Choropleth(
+            title=title,
+            values=dict(zip(ids, values.tolist())),
+            classes=dict(zip(ids, classes.tolist())),
+            palette=_palette(max(len(breaks) - 1, 1)) if len(breaks) else [],
+            breaks=breaks.tolist(),
+            no_data=NO_DATA_COLOR,
+            digits=digits,
+        )
+    return result
+
+
+def choropleths(cube):
+    """metric -> Choropleth of all METRICS for the cube, built once per cube version."""
+    return shared_cache.cached("district_metrics", cube.version, None, lambda: _build(cube))
+
+
+def choropleth(cube, metric):
+    """Choropleth of one metric, or None for the plain district layer (unknown / empty metric)."""
+    return choropleths(cube).get(metric)
@@ -0,0 +1,341 @@
+import json
+import os
+import re
+import threading
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+import data_cache
+import population_cube
+
+# Election results per Wahlbezirk (precinct), rolled up to any selection of Stadtteile.
+# Every election is ingested once into compact arrays (votes: parties × precincts).
+# Each precinct is mapped to a district ID once, and the votes, Wahlberechtigte and
+# Wähler are summed per district at load time. Shares, turnout and swing for a
+# district selection are then a sum over a few rows; no pandas work per render.
+#
+# Sources, one file per election (the name gives label and year, e.g.
+# gemeinderatswahl_2024.csv -> "Gemeinderatswahl 2024"):
+#   Input/wahlen/<name>.csv   wide: Wahlbezirk, [Wahlberechtigte], [Wähler], one column per party
+#                             long: Wahlbezirk, Partei, Stimmen, [Wahlberechtigte], [Wähler]
+#                             an optional Stadtteil column (name or ID) maps the precincts
+# Precinct -> Stadtteil, first match wins:
+#   Input/wahlen/wahlbezirke.csv                 Wahlbezirk, Stadtteil (name or ID)
+#   Input/wahlen/wahlbezirke.geojson (or .shp)   precinct polygons with a Wahlbezirk
+#                                                property, joined by representative point
+#                                                (cached in .cache/elections/)
+#   the Stadtteil column of the results file
+# Precincts without a district (e.g. Briefwahlbezirke) only count city-wide.
+# Without Input/wahlen/ the city-wide Input/wahlen.csv (Partei + Stimmen or percent) is
+# served as one election without districts.
+
+ELECTIONS_DIR = Path(os.environ.get("DASHBOARD_ELECTIONS_DIR", data_cache.INPUT_DIR / "wahlen"))
+LEGACY_PATH = data_cache.INPUT_DIR / "wahlen.csv"
+LEGACY_LABEL = "Gemeinderatswahl 2024"
+PRECINCT_FILE = "wahlbezirke"
+CACHE_DIR = data_cache.CACHE_DIR / "elections"
+
+PRECINCT_COLUMNS = ("Wahlbezirk", "Wahlbezirksnummer", "Bezirk")
+DISTRICT_COLUMNS = ("Stadtteil", "MIFSTADTT4")
+ELIGIBLE_COLUMNS = ("Wahlberechtigte",)
+VOTERS_COLUMNS = ("Wähler", "Waehler", "Wählende")
+PARTY_COLUMN = "Partei"
+VOTES_COLUMNS = ("Stimmen", "Anzahl", "Votes", "Stimmen_Prozent", "Prozent")
+# numeric columns of wide files that are no party
+META_COLUMNS = ("Ungültige", "Ungültige Stimmen", "Gültige", "Gültige Stimmen", "Wahlbezirksname", "Name")
+OTHERS = "Andere"
+
+_catalog = None          # (fingerprint of sources(), name -> Election)
+_lock = threading.Lock()
+
+
+class Result(NamedTuple):
+    parties: tuple
+    votes: np.ndarray           # per party (percent points for percent-only sources)
+    shares: np.ndarray          # per party, % of the valid votes
+    eligible: float             # Wahlberechtigte, NaN if unknown
+    voters: float               # Wähler, NaN if unknown
+    turnout: float              # %, NaN if unknown
+
+
+class Election:
+    """
+    name: file stem, label: display name, year: election year (0 if unknown)
+    parties: party names, rows of votes
+    precincts: Wahlbezirk keys, columns of votes
+    votes: array (parties, precincts), int32 counts (float for percent-only sources)
+    is_percent: votes are already shares in % (city-wide sources without counts)
+    eligible / voters: float per precinct (NaN if unknown)
+    district_of: district ID per precinct ("" = not mapped)
+    version: unique id of this build, used as cache key by consumers
+    """
+
+    def __init__(self, name, label, year, parties, precincts, votes, eligible, voters, district_of,
+                 is_percent=False):
+        self.name = name
+        self.label = label
+        self.year = year
+        self.parties = tuple(parties)
+        self.precincts = tuple(precincts)
+        self.votes = votes
+        self.eligible = eligible
+        self.voters = voters
+        self.district_of = tuple(district_of)
+        self.is_percent = is_percent
+        self.version = population_cube.next_version()
+        self.district_ids = tuple(sorted({d for d in self.district_of if d}))
+        self._row = {d: i for i, d in enumerate(self.district_ids)}
+        # (districts + unmapped) × (parties, Wahlberechtigte, Wähler), summed once
+        rows = np.array([self._row.get(d, len(self.district_ids)) for d in self.district_of], dtype=np.intp)
+        table = np.vstack([votes.astype(float), eligible, voters]).T
+        self._by_district = np.zeros((len(self.district_ids) + 1, table.shape[1]))
+        np.add.at(self._by_district, rows, table)
+        self._total = self._by_district.sum(axis=0)
+
+    @property
+    def has_districts(self):
+        return bool(self.district_ids)
+
+    def selection_index(self, district_ids=None):
+        # None (or an election without mapped precincts) means city-wide
+        if district_ids is None or not self.has_districts:
+            return None
+        return tuple(sorted({self._row[str(d)] for d in district_ids if str(d) in self._row}))
+
+    def result(self, district_ids=None):
+        """Votes, shares and turnout over the precincts of the selected district IDs."""
+        idx = self.selection_index(district_ids)
+        row = self._total if idx is None else self._by_district[list(idx)].sum(axis=0)
+        n = len(self.parties)
+        votes, eligible, voters = row[:n], row[n], row[n + 1]
+        valid = votes.sum()
+        if self.is_percent:
+            shares = votes
+        else:
+            shares = votes / valid * 100 if valid else np.full(n, np.nan)
+        turnout = voters / eligible * 100 if eligible > 0 else np.nan
+        return Result(self.parties, votes, shares, eligible, voters, turnout)
+
+    def ranking(self, top_n=8):
+        """Indices of the top_n parties city-wide, by share (fixed bar order)."""
+        return np.argsort(-self._total[:len(self.parties)], kind="stable")[:top_n]
+
+
+def swing(current, previous, district_ids=None):
+    """Share change in percentage points per party of current (NaN where previous has no such party)."""
+    now, before = current.result(district_ids), previous.result(district_ids)
+    before_by_party = dict(zip(before.parties, before.shares))
+    return np.array([s - before_by_party.get(p, np.nan) for p, s in zip(now.parties, now.shares)])
+
+
+def bars(election, district_ids=None, top_n=8):
+    """(labels, shares) of the top_n parties in the fixed ranking, the rest as "Andere"."""
+    result = election.result(district_ids)
+    top = election.ranking(top_n)
+    labels = [election.parties[i] for i in top]
+    shares = [float(result.shares[i]) for i in top]
+    if len(election.parties) > top_n:
+        labels.append(OTHERS)
+        shares.append(float(np.nansum(result.shares) - np.nansum(result.shares[top])))
+    return labels, shares
+
+
+def _first(columns, candidates):
+    return next((c for c in candidates if c in columns), None)
+
+
+def _key(value):
+    # precinct numbers come as int, float or text depending on the file
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _numeric(series):
+    return pd.to_numeric(series, errors="coerce")
+
+
+def _parse(df):
+    """(precincts, parties, votes, eligible, voters, district hints) of one results file."""
+    precinct_col = _first(df.columns, PRECINCT_COLUMNS)
+    if precinct_col is None:
+        raise ValueError(f"no precinct column (one of {', '.join(PRECINCT_COLUMNS)})")
+    df = df.assign(_precinct=df[precinct_col].map(_key))
+    eligible_col = _first(df.columns, ELIGIBLE_COLUMNS)
+    voters_col = _first(df.columns, VOTERS_COLUMNS)
+    district_col = _first(df.columns, DISTRICT_COLUMNS)
+
+    if PARTY_COLUMN in df.columns:
+        votes_col = _first(df.columns, VOTES_COLUMNS)
+        wide = df.pivot_table(index="_precinct", columns=PARTY_COLUMN, values=votes_col, aggfunc="sum", fill_value=0)
+        per_precinct = df.groupby("_precinct", sort=False).first()
+    else:
+        skip = {precinct_col, "_precinct", eligible_col, voters_col, district_col, *META_COLUMNS}
+        parties = [c for c in df.columns if c not in skip and _numeric(df[c]).notna().any()]
+        wide = df[["_precinct", *parties]].assign(**{p: _numeric(df[p]).fillna(0) for p in parties})
+        wide = wide.groupby("_precinct", sort=False).sum()
+        agg = {c: "sum" for c in (eligible_col, voters_col) if c}
+        if district_col:
+            agg[district_col] = "first"
+        per_precinct = df.groupby("_precinct", sort=False).agg(agg) if agg else pd.DataFrame(index=wide.index)
+
+    precincts = list(wide.index)
+    per_precinct = per_precinct.reindex(precincts)
+
+    def column(col):
+        if col is None:
+            return np.full(len(precincts), np.nan)
+        return _numeric(per_precinct[col]).to_numpy(dtype=float)
+
+    votes = wide.to_numpy(dtype=float).T
+    if np.all(votes == np.rint(votes)) and votes.max(initial=0) < 2**31:
+        votes = votes.astype(np.int32)
+    hints = per_precinct[district_col].tolist() if district_col else [None] * len(precincts)
+    return precincts, [str(p) for p in wide.columns], votes, column(eligible_col), column(voters_col), hints
+
+
+def _resolve(value):
+    """District ID for a district name or ID ("" if unknown)."""
+    import district_layer
+
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ""
+    reg = district_layer.registry()
+    value = _key(value)
+    return value if value in reg.names else (reg.district_id(value) or "")
+
+
+def _precinct_source():
+    for suffix in (".csv", ".geojson", ".shp"):
+        path = ELECTIONS_DIR / f"{PRECINCT_FILE}{suffix}"
+        if path.exists():
+            return path
+    return None
+
+
+def _spatial_join(path):
+    """Wahlbezirk -> district ID by representative point of the precinct polygons."""
+    import shapely
+
+    import facilities
+    import geometry_store
+
+    digest = data_cache.fingerprint(path, districts=data_cache.fingerprint(geometry_store.SOURCE_PATH))
+    cached = CACHE_DIR / f"{path.stem}-{digest}.json"
+    if cached.exists():
+        return json.loads(cached.read_text(encoding="utf-8"))
+
+    gdf = data_cache.read_geo(path, to_crs=geometry_store.UTM32)
+    precinct_col = _first(gdf.columns, PRECINCT_COLUMNS)
+    if precinct_col is None:
+        raise ValueError(f"{path.name}: no precinct column (one of {', '.join(PRECINCT_COLUMNS)})")
+    store = geometry_store.districts()
+    points = shapely.get_coordinates(gdf.geometry.representative_point().to_numpy())
+    rows = facilities.assign(points, store.utm.geometry.to_numpy())
+    ids = store.utm[facilities.ID_COL].astype(str).to_numpy()
+    mapping = {_key(p): (ids[r] if r >= 0 else "") for p, r in zip(gdf[precinct_col], rows)}
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = cached.with_name(f".{cached.name}.{os.getpid()}")
+    tmp.write_text(json.dumps(mapping), encoding="utf-8")
+    os.replace(tmp, cached)
+    return mapping
+
+
+def precinct_districts():
+    """Wahlbezirk -> district ID from the lookup table or precinct geometry ({} without one)."""
+    path = _precinct_source()
+    if path is None:
+        return {}
+    if path.suffix != ".csv":
+        return _spatial_join(path)
+    table = data_cache.read_csv(path)
+    precinct_col = _first(table.columns, PRECINCT_COLUMNS)
+    district_col = _first(table.columns, DISTRICT_COLUMNS)
+    if precinct_col is None or district_col is None:
+        raise ValueError(f"{path.name}: needs a precinct and a Stadtteil column")
+    return {_key(p): _resolve(d) for p, d in zip(table[precinct_col], table[district_col])}
+
+
+def _label(name):
+    words = name.replace("_", " ").replace("-", " ").split()
+    return " ".join(w[:1].upper() + w[1:] for w in words)
+
+
+def _year(name):
+    years = re.findall(r"(?:19|20)\d\d", name)
+    return int(years[-1]) if years else 0
+
+
+def load(path, mapping=None):
+    """One election from a precinct results file."""
+    precincts, parties, votes, eligible, voters, hints = _parse(data_cache.read_csv(path))
+    mapping = precinct_districts() if mapping is None else mapping
+    district_of = [mapping.get(p) or _resolve(h) for p, h in zip(precincts, hints)]
+    return Election(path.stem, _label(path.stem), _year(path.stem), parties, precincts, votes,
+                    eligible, voters, district_of)
+
+
+def _load_legacy():
+    df = data_cache.read_csv(LEGACY_PATH)
+    if PARTY_COLUMN not in df.columns:
+        return None
+    votes_col = _first(df.columns, VOTES_COLUMNS)
+    if votes_col is None:
+        return None
+    votes = _numeric(df[votes_col]).fillna(0).to_numpy(dtype=float)[:, None]
+    # same test as election_bar_chart, but made once at load time
+    is_percent = "prozent" in votes_col.lower() or 0 < votes.max(initial=0) <= 100
+    return Election("wahlen", LEGACY_LABEL, _year(LEGACY_LABEL), df[PARTY_COLUMN].fillna("keine Angabe").astype(str),
+                    [population_cube.ALL_DISTRICTS], votes, np.full(1, np.nan), np.full(1, np.nan), [""],
+                    is_percent=is_percent)
+
+
+def sources():
+    """Files the catalog is built from: results, precinct table or geometry, or the legacy file."""
+    files = sorted(p for p in ELECTIONS_DIR.glob("*.csv") if p.stem != PRECINCT_FILE) if ELECTIONS_DIR.is_dir() else []
+    if not files:
+        return [LEGACY_PATH] if LEGACY_PATH.exists() else []
+    precincts = _precinct_source()
+    if precincts is not None:
+        files.append(precincts)
+        if precincts.suffix != ".csv":
+            import geometry_store
+
+            files.append(geometry_store.SOURCE_PATH)      # spatial join
+    return files
+
+
+def _build(files):
+    results = [p for p in files if p.parent == ELECTIONS_DIR and p.suffix == ".csv" and p.stem != PRECINCT_FILE]
+    if results:
+        mapping = precinct_districts()
+        elections = [load(p, mapping) for p in results]
+    else:
+        legacy = _load_legacy() if LEGACY_PATH in files else None
+        elections = [legacy] if legacy is not None else []
+    elections.sort(key=lambda e: (e.year, e.label))
+    return {e.name: e for e in elections}
+
+
+def catalog():
+    """
+    name -> Election, oldest first. Built once and again whenever the content of one of
+    its sources() changed (checked by mtime and size, see data_cache.fingerprint).
+    """
+    global _catalog
+    files = sources()
+    key = data_cache.fingerprints(files)
+    if _catalog is None or _catalog[0] != key:
+        with _lock:
+            if _catalog is None or _catalog[0] != key:
+                _catalog = (key, _build(files))
+    return _catalog[1]
+
+
+def latest():
+    elections = list(catalog().values())
+    return elections[-1] if elections else None
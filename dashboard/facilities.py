@@ -0,0 +1,222 @@
+import json
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+import data_cache
+import geometry_store
+
+# Facilities (Kita, Schule, Arzt, ÖPNV) per Stadtteil.
+# Point datasets are loaded once, reprojected to UTM32 and assigned to the district
+# polygons with one STRtree query per layer. The per-district table (counts, densities
+# per 1.000 Einwohner and per ha, location score) is built once per process and shared
+# by the KPI boxes and the map info box.
+#
+# Point sources, first match wins:
+#   Input/facilities/<key>.geojson     any geometry type, representative points are used
+#   Input/facilities/<key>.csv         columns lon/lat (WGS84) or x/y (UTM32)
+# Without a point file only the location score (Pkte_*) of the statistical sub-districts
+# baked into Input/Pkte_*.html is available; it is joined by representative point and
+# averaged per district weighted by residents.
+
+ID_COL = "MIFSTADTT4"
+POPULATION_COL = "MIFSTADTT1"
+AREA_COL = "MIFSTADTT3"
+SUB_POPULATION_COL = "MIFSTATI01"
+POINTS_DIR = data_cache.INPUT_DIR / "facilities"
+
+
+class Layer:
+    def __init__(self, key, label, map_file, score_col):
+        self.key = key
+        self.label = label
+        self.map_file = map_file
+        self.score_col = score_col
+
+
+LAYERS = {
+    layer.key: layer for layer in (
+        Layer("kita", "Kitas", "Pkte_Kita.html", "Pkte_Kita"),
+        Layer("schule", "Schulen", "Pkte_Schule.html", "Pkte_Schulen"),
+        Layer("arzt", "Ärzte", "Pkte_Arzt.html", "Pkte_Arzt"),
+        Layer("oepnv", "ÖPNV-Haltestellen", "Pkte_Oepnv.html", "Pkte_Oepnv"),
+    )
+}
+
+_table = None
+_lock = threading.Lock()
+
+_FOLIUM_GEOJSON = re.compile(r"geo_json_[0-9a-f]+_add\(\s*(\{.*?\})\s*\);", re.S)
+
+
+def read_folium_geojson(path):
+    """GeoDataFrame (WGS84) of the first GeoJSON layer embedded in a folium HTML map."""
+    import geopandas as gpd
+
+    with open(path, encoding="utf-8") as f:
+        match = _FOLIUM_GEOJSON.search(f.read())
+    if match is None:
+        raise ValueError(f"no GeoJSON layer in {path}")
+    return gpd.GeoDataFrame.from_features(json.loads(match.group(1))["features"], crs=geometry_store.WGS84)
+
+
+def _coerce_points(df):
+    if {"lon", "lat"} <= set(df.columns):
+        x, y = geometry_store.to_utm32(df["lon"], df["lat"])
+        df["x"], df["y"] = x, y
+    return df
+
+
+def point_source(key):
+    """Path of the point file of a facility layer, or None."""
+    for suffix in (".geojson", ".csv"):
+        path = POINTS_DIR / f"{key}{suffix}"
+        if path.exists():
+            return path
+    return None
+
+
+def sources():
+    """Files the district table is built from: point files and the Pkte_* maps that exist."""
+    files = [point_source(key) for key in LAYERS]
+    files += [data_cache.INPUT_DIR / layer.map_file for layer in LAYERS.values()]
+    return [p for p in files if p is not None and p.exists()]
+
+
+def load_points(key):
+    """(n, 2) UTM32 coordinates of a facility layer, or None without a point source."""
+    import shapely
+
+    path = point_source(key)
+    if path is None:
+        return None
+    if path.suffix == ".geojson":
+        gdf = data_cache.read_geo(path, to_crs=geometry_store.UTM32)
+        return shapely.get_coordinates(gdf.geometry.representative_point().to_numpy())
+    df = data_cache.read_csv(path, coerce=_coerce_points)
+    return df[["x", "y"]].to_numpy(dtype=float)
+
+
+def assign(points, polygons):
+    """
+    District row for every point (-1 outside all districts).
+    points: (n, 2) coordinates, polygons: shapely geometry array in the same CRS.
+    """
+    import shapely
+
+    tree = shapely.STRtree(polygons)
+    geoms = shapely.points(np.asarray(points, dtype=float).reshape(-1, 2))
+    point_idx, poly_idx = tree.query(geoms, predicate="intersects")
+    # a point on a shared border counts once, for the first district
+    first = np.unique(point_idx, return_index=True)[1]
+    rows = np.full(len(geoms), -1, dtype=np.int64)
+    rows[point_idx[first]] = poly_idx[first]
+    return rows
+
+
+def _build():
+    import shapely
+
+    store = geometry_store.districts()
+    polygons = store.utm.geometry.to_numpy()
+    n = len(polygons)
+    residents = pd.to_numeric(store.utm[POPULATION_COL], errors="coerce").to_numpy(dtype=float)
+    area = pd.to_numeric(store.utm[AREA_COL], errors="coerce").to_numpy(dtype=float)
+    area = np.where(np.isfinite(area) & (area > 0), area, store.area_ha)
+
+    table = pd.DataFrame({"einwohner": residents, "flaeche_ha": area},
+                         index=store.utm[ID_COL].astype(str).to_numpy())
+    for key, layer in LAYERS.items():
+        points = load_points(key)
+        if points is None:
+            table[key] = np.nan
+        else:
+            rows = assign(points, polygons)
+            table[key] = np.bincount(rows[rows >= 0], minlength=n).astype(float)
+
+        # location score of the statistical sub-districts, weighted by residents
+        sub = data_cache.read_geo(data_cache.INPUT_DIR / layer.map_file, to_crs=geometry_store.UTM32,
+                                  parse=read_folium_geojson)
+        rows = assign(shapely.get_coordinates(sub.geometry.representative_point().to_numpy()), polygons)
+        score = pd.to_numeric(sub[layer.score_col], errors="coerce").to_numpy(dtype=float)
+        weight = pd.to_numeric(sub[SUB_POPULATION_COL], errors="coerce").fillna(0).to_numpy(dtype=float)
+        ok = (rows >= 0) & np.isfinite(score)
+        num = np.bincount(rows[ok], weights=score[ok] * weight[ok], minlength=n)
+        den = np.bincount(rows[ok], weights=weight[ok], minlength=n)
+        table[f"{key}_punkte"] = np.divide(num, den, out=np.full(n, np.nan), where=den > 0)
+
+    for key in LAYERS:
+        table[f"{key}_je_1000_ew"] = table[key] / table["einwohner"].where(table["einwohner"] > 0) * 1000
+        table[f"{key}_je_ha"] = table[key] / table["flaeche_ha"]
+    return table
+
+
+def district_table():
+    """
+    Per-district DataFrame indexed by district ID (MIFSTADTT4) with einwohner, flaeche_ha
+    and per layer: <key> (count, NaN without point data), <key>_je_1000_ew, <key>_je_ha,
+    <key>_punkte (residents-weighted location score).
+    """
+    global _table
+    if _table is None:
+        with _lock:
+            if _table is None:
+                _table = _build()
+    return _table
+
+
+def reset():
+    """Drops the district table (a source changed); it is rebuilt on next use."""
+    global _table
+    with _lock:
+        _table = None
+
+
+def summary(key, district_ids=None):
+    """Count, densities and score of one layer summed over a set of district IDs."""
+    table = district_table()
+    if district_ids is not None:
+        table = table.loc[table.index.intersection([str(i) for i in district_ids])]
+    residents, area = table["einwohner"].sum(), table["flaeche_ha"].sum()
+    count = table[key].sum(min_count=1)
+    weights = table["einwohner"].where(table[f"{key}_punkte"].notna(), 0)
+    return {
+        "anzahl": count,
+        "je_1000_ew": count / residents * 1000 if residents else np.nan,
+        "je_ha": count / area if area else np.nan,
+        "punkte": (table[f"{key}_punkte"].fillna(0) * weights).sum() / weights.sum() if weights.sum() else np.nan,
+    }
+
+
+def _fmt(value, digits):
+    return "k.A." if pd.isna(value) else f"{value:,.{digits}f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+def kpi_text(key, district_ids=None):
+    """
+    Value-box text: count and density. Without point data it is "k.A.": the boxes are
+    titled as counts, the location score (which can be negative) is on the map.
+    """
+    s = summary(key, district_ids)
+    if pd.isna(s["anzahl"]):
+        return "k.A."
+    return f"{_fmt(s['anzahl'], 0)} ({_fmt(s['je_1000_ew'], 2)} je 1.000 EW)"
+
+
+def popup_html(district_id):
+    """Facility rows for the map info box of one district."""
+    table = district_table()
+    district_id = str(district_id)
+    if district_id not in table.index:
+        return ""
+    row = table.loc[district_id]
+    items = []
+    for key, layer in LAYERS.items():
+        if pd.isna(row[key]):
+            text = f"{_fmt(row[f'{key}_punkte'], 2)} Pkte"
+        else:
+            text = f"{_fmt(row[key], 0)} ({_fmt(row[f'{key}_je_1000_ew'], 1)} je 1.000 EW, {_fmt(row[f'{key}_je_ha'], 2)} je ha)"
+        items.append(f"<p style='margin: 5px 0;'><b>{layer.label}:</b> {text}</p>")
+    return "<div style='border-top: 1px solid #eee; padding: 8px 10px 0;'>" + "".join(items) + "</div>"
@@ -0,0 +1,188 @@
+import math
+
+import elections
+import forecast
+import plotly_output
+import shared_cache
+
+# Plotly figures of app.py, built from plain data so they can be prebuilt outside a
+# session (warmup.py). Data and finished figures are kept in shared_cache per (cube
+# version, selection index), so selections that select the same cube rows share one
+# entry. Figures rendered through plotly_output are cached as their HTML fragment
+# (keyed "html:<output id>"), so a render is a cache read.
+
+# trace label -> row of forecast_mc.QUANTILES, in drawing order
+FAN_BANDS = {"5 %": 0, "95 %": 4, "25 %": 1, "75 %": 3}
+NO_BANDS = {label: [] for label in FAN_BANDS}
+PIE_TOP_N = 8
+PIE_OUTPUTS = {"Familienstand": "family_pie", "Religion": "religion_pie", "Staatsangehörigkeit": "citizenship_pie"}
+ELECTION_TOP_N = 8
+
+
+def pyramid_figure(d):
+    """d: DataFrame with Alter, Männer, Frauen."""
+    import plotly.graph_objects as go
+
+    # Left side should be negative for Männer to mirror the pyramid
+    d_plot = d.copy()
+    d_plot["Männer"] = -d_plot["Männer"].abs()
+
+    # Create the plot using Plotly
+    fig = go.Figure()
+
+    # Add Men data (left side, negative values)
+    fig.add_trace(go.Bar(
+        y=d_plot["Alter"],
+        x=d_plot["Männer"]/1000,
+        orientation='h',
+        name='Männer',
+        marker=dict(color='light blue'),
+        hoverinfo='x+y+name',
+        hovertemplate='<b>Männer</b><br>Alter: %{y}<br>Anzahl: %{x}<extra></extra>'
+    ))
+
+    # Add Women data (right side, positive values)
+    fig.add_trace(go.Bar(
+        y=d_plot["Alter"],
+        x=d_plot["Frauen"]/1000,
+        orientation='h',
+        name='Frauen',
+        marker=dict(color='pink'),
+        hoverinfo='x+y+name',
+        hovertemplate='<b>Frauen</b><br>Alter: %{y}<br>Anzahl: %{x}<extra></extra>'
+    ))
+
+    # Update layout for pyramid appearance
+    fig.update_layout(
+        barmode='overlay',
+        yaxis=dict(
+            title='Alter in Jahren',
+            range=[0,100]  # Adjust range as needed
+        ),
+        xaxis=dict(
+            title='Anzahl',
+        ),
+        showlegend=True,
+        bargap=0.1,
+        height=650,  # Set fixed height in pixels
+        width=None  # Let width be responsive
+    )
+    return fig
+
+
+def forecast_figure(lines, bands):
+    """lines: scenario -> totals per year, bands: FAN_BANDS label -> totals in Tsd. (may be empty)."""
+    import plotly.graph_objects as go
+
+    fig = go.Figure()
+    x = list(range(forecast.BASE_YEAR, forecast.BASE_YEAR + len(next(iter(lines.values())))))
+    # outer band first, so "tonexty" fills 5-95 % lightly and 25-75 % darker on top
+    for label, y in bands.items():
+        lower = label in ("5 %", "25 %")
+        fig.add_trace(go.Scatter(
+            x=x, y=y, name=label, mode="lines", line=dict(width=0),
+            fill=None if lower else "tonexty",
+            fillcolor="rgba(31, 119, 180, 0.15)" if label == "95 %" else "rgba(31, 119, 180, 0.3)",
+            showlegend=False,
+            hovertemplate=f"<b>{label}</b><br>Jahr: %{{x}}<br>Einwohner (Tsd.): %{{y:.1f}}<extra></extra>",
+        ))
+    for name, y in lines.items():
+        custom = name == "Eigenes Szenario"
+        fig.add_trace(go.Scatter(
+            x=x,
+            y=y / 1000,
+            name=name,
+            mode="lines",
+            line=dict(width=3 if custom else 1.5, dash=None if custom else "dot"),
+            hovertemplate=f"<b>{name}</b><br>Jahr: %{{x}}<br>Einwohner (Tsd.): %{{y:.1f}}<extra></extra>",
+        ))
+    fig.update_layout(
+        yaxis=dict(title="Einwohner in Tsd."),
+        margin=dict(t=30, b=40, l=10, r=10),
+        legend=dict(orientation="h"),
+    )
+    return fig
+
+
+def age_table(cube, selection):
+    """Männer/Frauen by Alter across the selected Stadtteile (shared across sessions)."""
+    import pandas as pd
+
+    def compute():
+        ages, men, women = cube.pyramid(selection)
+        return pd.DataFrame({"Alter": ages, "Männer": men, "Frauen": women})
+
+    return shared_cache.cached("agg_by_age", cube.version, cube.selection_index(selection), compute)
+
+
+def forecast_lines(cube, selection, custom):
+    """Totals of the standard scenarios plus the custom one (shared across sessions)."""
+    def compute():
+        lines = {name: forecast.totals(cube, s, selection) for name, s in forecast.SCENARIOS.items()}
+        lines["Eigenes Szenario"] = forecast.totals(cube, custom, selection)
+        return lines
+
+    return shared_cache.cached(("forecast_lines", custom), cube.version, cube.selection_index(selection), compute)
+
+
+def pyramid(cube, selection):
+    """HTML of the Alterspyramide output over the selected Stadtteile."""
+    return shared_cache.cached("html:alterspyramide", cube.version, cube.selection_index(selection),
+                               lambda: plotly_output.html(pyramid_figure(age_table(cube, selection)), "alterspyramide"))
+
+
+def forecast_plot(cube, selection, custom, bands=None):
+    """HTML of the forecast output; only the one without Monte Carlo bands is shared."""
+    if bands is not None and any(len(y) for y in bands.values()):
+        return plotly_output.html(forecast_figure(forecast_lines(cube, selection, custom), bands), "forecast_plot")
+    return shared_cache.cached(("html:forecast_plot", custom), cube.version, cube.selection_index(selection),
+                               lambda: plotly_output.html(forecast_figure(forecast_lines(cube, selection, custom), NO_BANDS),
+                                                          "forecast_plot"))
+
+
+def pie(index, column, selection):
+    """HTML of the pie of a frequency_index.FrequencyIndex column over the selected Stadtteile."""
+    import pie_chart
+
+    return shared_cache.cached(
+        ("html:pie", column), index.version, index.selection_index(selection),
+        lambda: plotly_output.html(pie_chart.pie_chart_from_column(index, column, PIE_TOP_N, selection=selection),
+                                   PIE_OUTPUTS.get(column, f"pie_{column}")),
+    )
+
+
+def election_bars(election, district_ids, previous=None):
+    """(labels, shares, texts) of the election bars; texts carry the swing against previous."""
+    labels, shares = elections.bars(election, district_ids, ELECTION_TOP_N)
+    texts = [f"{share:.1f} %" for share in shares]
+    if previous is not None:
+        change = dict(zip(election.parties, elections.swing(election, previous, district_ids)))
+        for i, label in enumerate(labels):
+            delta = change.get(label)
+            if delta is not None and not math.isnan(delta):
+                texts[i] += f" ({delta:+.1f})"
+    return labels, shares, texts
+
+
+def election_figure(labels, shares, texts):
+    import plotly.graph_objects as go
+
+    fig = go.Figure(go.Bar(
+        x=labels, y=shares, text=texts, textposition="outside", cliponaxis=False,
+        hovertemplate="<b>%{x}</b><br>%{text}<extra></extra>",
+    ))
+    fig.update_layout(
+        yaxis=dict(title="Prozent", ticksuffix=" %"),
+        margin=dict(t=40, b=40, l=10, r=10),
+        xaxis_tickangle=-30,
+        showlegend=False,
+    )
+    return fig
+
+
+def election(election, district_ids, previous=None):
+    """HTML of the bars of an elections.Election over the selected district IDs (shared across sessions)."""
+    key = ("html:election_bar", None if previous is None else previous.version)
+    return shared_cache.cached(key, election.version, election.selection_index(district_ids),
+                               lambda: plotly_output.html(election_figure(*election_bars(election, district_ids, previous)),
+                                                          "election_bar"))
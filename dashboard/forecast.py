@@ -0,0 +1,140 @@
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+import numpy as np
+
+# Cohort-component population projection (Bevölkerungsprognose).
+# State: population[district, age, sex] with sex 0 = Männer, 1 = Frauen (as in the cube).
+# One year is a single matrix product with a (2A × 2A) Leslie-type matrix holding
+# survival (sub-diagonal, open top age class), births (first row of each sex block)
+# and is followed by adding net migration. All districts are projected together;
+# results are memoized per (base population, scenario, horizon), least recently used out.
+# Stochastic fan charts on top of this model live in forecast_mc.py.
+
+BASE_YEAR = 2022                   # Input/2022.xlsx
+SEX_RATIO_AT_BIRTH = 1.05          # boys per girl
+FERTILE_AGES = (15, 49)
+
+# Gompertz-Makeham hazard a + b * exp(c * age); calibrated to e0 ≈ 78 (m) / 83 (w)
+MORTALITY = {"a": 2e-4, "b": (3.0e-5, 1.8e-5), "c": 0.095, "q0": (0.0035, 0.003)}
+
+
+class Scenario(NamedTuple):
+    tfr: float = 1.46                 # Kinder je Frau
+    mean_age_birth: float = 31.0      # mittleres Gebäralter
+    mortality: float = 1.0            # Faktor auf die Sterblichkeit (1 = Basis)
+    net_migration: float = 3.0        # Wanderungssaldo je 1.000 Einwohner und Jahr
+
+
+SCENARIOS = {
+    "niedrig": Scenario(tfr=1.3, mortality=1.1, net_migration=0.0),
+    "mittel": Scenario(),
+    "hoch": Scenario(tfr=1.7, mortality=0.9, net_migration=6.0),
+}
+
+_MAX_RESULTS = 64
+_results = OrderedDict()
+_lock = threading.Lock()
+
+
+def survival_rates(n_ages, mortality=1.0):
+    """
+    Probability to survive from age x to x + 1, shape (n_ages, 2).
+    mortality may also be an array of factors, the result then has shape (..., n_ages, 2).
+    """
+    m = np.asarray(mortality, dtype=float)[..., None, None]
+    ages = np.arange(n_ages)[:, None]
+    hazard = MORTALITY["a"] + np.asarray(MORTALITY["b"]) * np.exp(MORTALITY["c"] * ages)
+    q = 1 - np.exp(-hazard * m)
+    q[..., 0, :] = np.minimum(np.asarray(MORTALITY["q0"]) * m[..., 0, :], 1)
+    return np.clip(1 - q, 0, 1)
+
+
+def fertility_rates(n_ages, tfr, mean_age_birth):
+    """Age-specific fertility rates (births per woman and year), summing to tfr."""
+    ages = np.arange(n_ages)
+    lo, hi = FERTILE_AGES
+    shape = np.where((ages >= lo) & (ages <= hi), np.exp(-0.5 * ((ages - mean_age_birth) / 5.5) ** 2), 0.0)
+    return tfr * shape / shape.sum() if shape.sum() else shape
+
+
+def migration_profile(n_ages):
+    """Age/sex distribution of net migrants, shape (n_ages, 2), summing to 1."""
+    ages = np.arange(n_ages)
+    profile = np.exp(-0.5 * ((ages - 25) / 8.0) ** 2) + 0.15 * np.exp(-ages / 30.0)
+    profile = profile / profile.sum() / 2
+    return np.column_stack([profile, profile])
+
+
+def projection_matrix(n_ages, scenario):
+    """
+    (2A × 2A) matrix M with population_next = population @ M.T for the flattened
+    state [Männer 0..A-1, Frauen 0..A-1].
+    """
+    s = survival_rates(n_ages, scenario.mortality)
+    f = fertility_rates(n_ages, scenario.tfr, scenario.mean_age_birth)
+    boys = SEX_RATIO_AT_BIRTH / (1 + SEX_RATIO_AT_BIRTH)
+    A = n_ages
+    M = np.zeros((2 * A, 2 * A))
+    for sex in (0, 1):
+        o = sex * A
+        idx = np.arange(A - 1)
+        M[o + idx + 1, o + idx] = s[:-1, sex]
+        M[o + A - 1, o + A - 1] = s[-1, sex]           # open top age class stays
+        # births to women alive at the start of the year, survived to age 0
+        share = boys if sex == 0 else 1 - boys
+        M[o, A:] += f * share * s[0, sex]
+    return M
+
+
+def project(population, scenario=Scenario(), years=50, key=None):
+    """
+    population: array (districts, ages, 2) of the base year (or (ages, 2)).
+    Returns an array (years + 1, districts, ages, 2); index 0 is the base year.
+    key: hashable id of the base population (e.g. (cube.version, "pyr")) to enable memoization.
+    """
+    cache_key = None if key is None else (key, Scenario(*scenario), years)
+    if cache_key is not None:
+        with _lock:
+            hit = _results.get(cache_key)
+            if hit is not None:
+                _results.move_to_end(cache_key)      # least recently used is evicted first
+                return hit
+
+    pop = np.asarray(population, dtype=float)
+    if pop.ndim == 2:
+        pop = pop[None]
+    n_districts, n_ages, _ = pop.shape
+    M = projection_matrix(n_ages, scenario)
+    mig = migration_profile(n_ages).T.reshape(-1)        # flattened like the state
+
+    state = pop.transpose(0, 2, 1).reshape(n_districts, 2 * n_ages)
+    out = np.empty((years + 1, n_districts, 2 * n_ages))
+    out[0] = state
+    for t in range(years):
+        total = state.sum(axis=1, keepdims=True)
+        state = state @ M.T + total * (scenario.net_migration / 1000) * mig
+        np.maximum(state, 0, out=state)
+        out[t + 1] = state
+    result = out.reshape(years + 1, n_districts, 2, n_ages).transpose(0, 1, 3, 2)
+
+    if cache_key is not None:
+        with _lock:
+            _results[cache_key] = result
+            if len(_results) > _MAX_RESULTS:
+                _results.popitem(last=False)
+    return result
+
+
+def base_population(cube):
+    """(districts, ages, 2) base population from a population cube (all residence types)."""
+    return cube.counts[:, :-1, :2, :].sum(axis=3)
+
+
+def totals(cube, scenario=Scenario(), selection=None, years=50):
+    """Projected total population per year for a district selection of the cube."""
+    result = project(base_population(cube), scenario, years, key=(cube.version, "base"))
+    idx = cube.selection_index(selection)
+    sub = result if idx is None else result[:, list(idx)]
+    return sub.sum(axis=(1, 2, 3))
@@ -0,0 +1,149 @@
+import hashlib
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+
+import data_cache
+import forecast
+
+# Monte Carlo fan charts for the Bevölkerungsprognose.
+# Every path draws its own fertility, mortality and migration trajectory around a
+# forecast.Scenario. Paths are simulated in chunks in a process pool; every chunk gets
+# its own child of one SeedSequence, so results only depend on the seed, not on the
+# number of workers. Chunks do not return paths but a histogram of
+# total / deterministic total per year, which is merged and turned into quantile bands.
+# Bands are cached on disk (.cache/forecast/) keyed by base population and parameters.
+
+MODEL_VERSION = 1
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+CHUNK_PATHS = 250          # paths per task
+BATCH_PATHS = 50           # paths held in memory at once inside a task
+RATIO_RANGE = (0.4, 1.8)   # histogram range of total / deterministic total
+N_BINS = 2800              # 0.05 % resolution inside RATIO_RANGE
+CACHE_DIR = data_cache.CACHE_DIR / "forecast"
+
+
+class Uncertainty(NamedTuple):
+    tfr_sd: float = 0.03            # yearly random-walk step of the TFR
+    mortality_sd: float = 0.02      # yearly random-walk step of log(mortality factor)
+    migration_sd: float = 2.0       # yearly noise of the net migration rate (per 1.000)
+
+
+_bands = {}
+_lock = threading.Lock()
+_executor = None
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        workers = max(1, min(os.cpu_count() or 1, 8))
+        _executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def _simulate_chunk(base, scenario, uncertainty, years, n_paths, seed, det_totals):
+    """Worker: simulates n_paths and returns a (years + 1, N_BINS + 2) histogram."""
+    rng = np.random.default_rng(seed)
+    n_ages = base.shape[0]
+    fert_shape = forecast.fertility_rates(n_ages, 1.0, scenario.mean_age_birth)
+    boys = forecast.SEX_RATIO_AT_BIRTH / (1 + forecast.SEX_RATIO_AT_BIRTH)
+    profile = forecast.migration_profile(n_ages)
+    lo, hi = RATIO_RANGE
+    hist = np.zeros((years + 1) * (N_BINS + 2), dtype=np.int64)
+    offsets = np.arange(years + 1) * (N_BINS + 2)
+
+    for start in range(0, n_paths, BATCH_PATHS):
+        b = min(BATCH_PATHS, n_paths - start)
+        tfr = np.maximum(scenario.tfr + np.cumsum(rng.normal(0, uncertainty.tfr_sd, (b, years)), axis=1), 0.3)
+        mort = scenario.mortality * np.exp(np.cumsum(rng.normal(0, uncertainty.mortality_sd, (b, years)), axis=1))
+        mig = scenario.net_migration + rng.normal(0, uncertainty.migration_sd, (b, years))
+
+        pop = np.broadcast_to(base, (b,) + base.shape).copy()       # (path, age, sex)
+        totals = np.empty((b, years + 1))
+        totals[:, 0] = pop.sum(axis=(1, 2))
+        for t in range(years):
+            s = forecast.survival_rates(n_ages, mort[:, t])
+            births = (pop[:, :, 1] * fert_shape).sum(axis=1) * tfr[:, t]
+            nxt = np.zeros_like(pop)
+            nxt[:, 1:] = pop[:, :-1] * s[:, :-1]
+            nxt[:, -1] += pop[:, -1] * s[:, -1]
+            nxt[:, 0, 0] = births * boys * s[:, 0, 0]
+            nxt[:, 0, 1] = births * (1 - boys) * s[:, 0, 1]
+            nxt += (totals[:, t] * mig[:, t] / 1000)[:, None, None] * profile
+            pop = np.maximum(nxt, 0)
+            totals[:, t + 1] = pop.sum(axis=(1, 2))
+
+        # bin k (1..N_BINS) is centred on lo + (k - 1) * width, so ratio 1 hits a centre
+        ratio = totals / np.where(det_totals > 0, det_totals, 1)
+        k = np.rint((ratio - lo) / (hi - lo) * N_BINS).astype(np.int64)
+        idx = np.clip(k + 1, 0, N_BINS + 1)
+        hist += np.bincount((idx + offsets).ravel(), minlength=hist.size)
+    return hist.reshape(years + 1, N_BINS + 2)
+
+
+def _quantiles(hist, det_totals):
+    lo, hi = RATIO_RANGE
+    width = (hi - lo) / N_BINS
+    cdf = np.cumsum(hist, axis=1) / hist.sum(axis=1, keepdims=True)
+    out = np.empty((len(QUANTILES), hist.shape[0]))
+    for i, q in enumerate(QUANTILES):
+        b = (cdf < q).sum(axis=1)                           # first bin reaching q
+        ratio = np.clip(lo + (b - 1) * width, lo, hi)       # bin centre (under/overflow clamped)
+        out[i] = ratio * det_totals
+    return out
+
+
+def _cache_key(base, scenario, uncertainty, years, n_paths, seed):
+    h = hashlib.sha256(np.ascontiguousarray(base, dtype=float).tobytes())
+    h.update(repr((MODEL_VERSION, forecast.MORTALITY, tuple(scenario), tuple(uncertainty),
+                   years, n_paths, seed, QUANTILES, RATIO_RANGE, N_BINS)).encode())
+    return h.hexdigest()[:24]
+
+
+def fan_chart(base, scenario=forecast.Scenario(), uncertainty=Uncertainty(),
+              years=50, n_paths=2000, seed=2022):
+    """
+    base: (ages, 2) base population. Returns an array (len(QUANTILES), years + 1)
+    with the projected total population per quantile and year.
+    """
+    base = np.asarray(base, dtype=float)
+    key = _cache_key(base, scenario, uncertainty, years, n_paths, seed)
+    if key in _bands:
+        return _bands[key]
+
+    path = CACHE_DIR / f"{key}.npy"
+    if path.exists():
+        bands = np.load(path)
+    else:
+        det_totals = forecast.project(base, scenario, years)[:, 0].sum(axis=(1, 2))
+        n_chunks = math.ceil(n_paths / CHUNK_PATHS)
+        seeds = np.random.SeedSequence(seed).spawn(n_chunks)
+        sizes = [min(CHUNK_PATHS, n_paths - i * CHUNK_PATHS) for i in range(n_chunks)]
+        args = [(base, scenario, uncertainty, years, n, s, det_totals) for n, s in zip(sizes, seeds)]
+        if n_chunks == 1:
+            hists = [_simulate_chunk(*args[0])]
+        else:
+            hists = list(_pool().map(_simulate_chunk, *zip(*args)))
+        bands = _quantiles(sum(hists), det_totals)
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = CACHE_DIR / f".{key}.{os.getpid()}.npy"
+        np.save(tmp, bands)
+        os.replace(tmp, path)
+
+    with _lock:
+        _bands[key] = bands
+    return bands
+
+
+def fan_chart_for(cube, scenario=forecast.Scenario(), selection=None, **kwargs):
+    """Fan chart for a district selection of a population cube (the model is linear)."""
+    base = forecast.base_population(cube)
+    idx = cube.selection_index(selection)
+    base = base.sum(axis=0) if idx is None else base[list(idx)].sum(axis=0)
+    return fan_chart(base, scenario, **kwargs)
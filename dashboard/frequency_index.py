@@ -0,0 +1,168 @@
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import population_cube
+
+# Frequency index for categorical columns (Familienstand, Religion, Staatsangehörigkeit, …).
+# Each value is dictionary-encoded to a category slot and counted per Stadtteil into one
+# matrix (Stadtteile × categories of all columns). A pie for any district selection is
+# then a sum over a few rows plus a partial top-N sort; value_counts() on the frame is
+# never needed. Built from microdata chunks (microdata.py, same pass as the cube), from
+# a frame, or from pre-aggregated counts (one row per category and Stadtteil with a
+# count column).
+
+MISSING = "keine Angabe"
+OTHERS = "Andere"
+
+
+class FrequencyIndex:
+    """
+    counts: int64 array (Stadtteile, categories of all columns)
+    districts / has_districts: as in PopulationCube
+    categories: column -> category labels, in the order of its slice of counts
+    version: unique id of this build, used as cache key by consumers
+    """
+
+    def __init__(self, counts, districts, has_districts, categories):
+        self.counts = counts
+        self.districts = tuple(districts)
+        self.has_districts = has_districts
+        self.categories = {col: list(labels) for col, labels in categories.items()}
+        self.version = population_cube.next_version()
+        self._index = {name: i for i, name in enumerate(self.districts)}
+        self._total = counts.sum(axis=0)
+        self._slices = {}
+        start = 0
+        for col, labels in self.categories.items():
+            self._slices[col] = slice(start, start + len(labels))
+            start += len(labels)
+
+    @property
+    def columns(self):
+        return list(self.categories)
+
+    def selection_index(self, selection=None):
+        if selection is None or not self.has_districts:
+            return None
+        return tuple(sorted({self._index[s] for s in selection if s in self._index}))
+
+    def value_counts(self, column, selection=None):
+        """Count per category of column over the selected Stadtteile."""
+        cols = self._slices[column]
+        idx = self.selection_index(selection)
+        if idx is None:
+            return self._total[cols]
+        return self.counts[list(idx), cols].sum(axis=0)
+
+    def top(self, column, selection=None, top_n=8):
+        """
+        (labels, counts) of the top_n categories in descending order; the rest is
+        summed up as "Andere". Categories without any count are left out.
+        """
+        counts = self.value_counts(column, selection)
+        labels = self.categories[column]
+        nonzero = np.flatnonzero(counts)
+        if len(nonzero) > top_n:
+            part = nonzero[np.argpartition(-counts[nonzero], top_n - 1)[:top_n]]
+            rest = int(counts.sum() - counts[part].sum())
+        else:
+            part, rest = nonzero, 0
+        part = part[np.argsort(-counts[part], kind="stable")]
+        out_labels = [labels[i] for i in part]
+        out_counts = counts[part].tolist()
+        if rest:
+            out_labels.append(OTHERS)
+            out_counts.append(rest)
+        return out_labels, out_counts
+
+
+class Builder:
+    """
+    Folds frames into an index one at a time (add), so a stream can feed it next to
+    other aggregates. weight_col: count column of pre-aggregated rows; without it every
+    row counts once.
+    """
+
+    def __init__(self, columns, weight_col=None):
+        self.columns = list(columns)
+        self.weight_col = weight_col
+        self._slots = population_cube.DistrictSlots()
+        self._categories = {col: {} for col in self.columns}       # column -> {label: slot}
+        self._counts = {col: np.zeros((0, 0), dtype=np.int64) for col in self.columns}
+
+    def add(self, df):
+        d = self._slots.codes(df)
+        weights = None
+        if self.weight_col is not None:
+            weights = pd.to_numeric(df[self.weight_col], errors="coerce").fillna(0).to_numpy()
+        for col in self.columns:
+            if col not in df.columns:
+                continue
+            codes, uniques = pd.factorize(df[col])
+            labels = [*map(str, uniques), MISSING]
+            codes = np.where(codes < 0, len(uniques), codes)
+            slots = self._categories[col]
+            c = np.array([slots.setdefault(label, len(slots)) for label in labels], dtype=np.intp)[codes]
+            shape = (len(self._slots), len(slots))
+            part = np.bincount(np.ravel_multi_index((d, c), shape), weights=weights, minlength=shape[0] * shape[1])
+            part = np.rint(part).astype(np.int64).reshape(shape)
+            old = self._counts[col]
+            part[:old.shape[0], :old.shape[1]] += old
+            self._counts[col] = part
+
+    def build(self):
+        n = len(self._slots)
+        if not n:
+            return FrequencyIndex(np.zeros((1, 0), dtype=np.int64), [population_cube.ALL_DISTRICTS], False, {})
+        blocks, categories = [], {}
+        for col in self.columns:
+            names = list(self._categories[col])
+            block = np.zeros((n, len(names)), dtype=np.int64)
+            old = self._counts[col]
+            block[:old.shape[0], :old.shape[1]] = old
+            # categories in order of their total count, like value_counts(); unused ones dropped
+            totals = block.sum(axis=0)
+            keep = [i for i in np.argsort(-totals, kind="stable") if totals[i]]
+            blocks.append(block[:, keep])
+            categories[col] = [names[i] for i in keep]
+        matrix = np.concatenate(blocks, axis=1) if blocks else np.zeros((n, 0), dtype=np.int64)
+        districts, rows = self._slots.order(matrix)
+        return FrequencyIndex(matrix[rows], districts, self._slots.has_districts, categories)
+
+
+def from_chunks(chunks, columns, weight_col=None):
+    """Index of columns over an iterable of frames (read once)."""
+    builder = Builder(columns, weight_col)
+    for df in chunks:
+        builder.add(df)
+    return builder.build()
+
+
+def from_frame(df, columns):
+    """Index of columns of one frame with one row per person."""
+    return from_chunks([df], [c for c in columns if c in df.columns])
+
+
+def from_counts(df, column, count_col):
+    """Index of pre-aggregated counts: one row per category (and Stadtteil) with count_col."""
+    return from_chunks([df], [column], weight_col=count_col)
+
+
+_MAX_FRAMES = 8
+_frames = OrderedDict()   # (id(df), column) -> (df, index); the df reference keeps the id from being reused
+
+
+def for_column(df, column):
+    """Index of one column of a frame, built once per frame (e.g. for the app's raw tables)."""
+    key = (id(df), column)
+    entry = _frames.get(key)
+    if entry is not None and entry[0] is df:
+        _frames.move_to_end(key)
+        return entry[1]
+    index = from_frame(df, [column])
+    _frames[key] = (df, index)
+    if len(_frames) > _MAX_FRAMES:
+        _frames.popitem(last=False)
+    return index
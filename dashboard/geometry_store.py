@@ -0,0 +1,74 @@
+import threading
+from functools import lru_cache
+
+import numpy as np
+
+import data_cache
+
+# District geometry in both coordinate systems, reprojected once at data-preparation
+# time (GeoParquet cache, see data_cache.py) instead of on every process start:
+#   utm    ETRS89 / UTM32 (EPSG:25832), metres -> areas, distances, spatial joins
+#   wgs84  WGS84 (EPSG:4326), degrees           -> Leaflet
+# Ad-hoc points go through one cached pyproj transformer per direction.
+#
+#   python geometry_store.py      # prepare the cache ahead of deployment
+
+UTM32 = 25832
+WGS84 = 4326
+SOURCE_PATH = data_cache.ROOT_DIR / "Input" / "stadtteil.geojson"
+
+_store = None
+_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def transformer(src=UTM32, dst=WGS84):
+    """Shared, thread-safe pyproj transformer (always x/y = lon/lat order)."""
+    from pyproj import Transformer
+
+    return Transformer.from_crs(src, dst, always_xy=True)
+
+
+def to_wgs84(x, y):
+    """UTM32 easting/northing (scalars or arrays) -> (lon, lat)."""
+    return transformer(UTM32, WGS84).transform(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+
+
+def to_utm32(lon, lat):
+    """WGS84 lon/lat (scalars or arrays) -> (x, y) in metres."""
+    return transformer(WGS84, UTM32).transform(np.asarray(lon, dtype=float), np.asarray(lat, dtype=float))
+
+
+class DistrictGeometry:
+    """
+    utm / wgs84: GeoDataFrames with identical row order and attributes
+    area_ha: polygon area from the UTM32 geometry, in hectares
+    """
+
+    def __init__(self, utm, wgs84):
+        self.utm = utm
+        self.wgs84 = wgs84
+        self.area_ha = utm.geometry.area.to_numpy() / 10_000
+
+
+def districts():
+    global _store
+    if _store is None:
+        with _lock:
+            if _store is None:
+                utm = data_cache.read_geo(SOURCE_PATH, crs=UTM32)
+                wgs84 = data_cache.read_geo(SOURCE_PATH, crs=UTM32, to_crs=WGS84)
+                _store = DistrictGeometry(utm, wgs84)
+    return _store
+
+
+def reset():
+    """Drops the loaded geometry (the source changed); the next districts() reads it again."""
+    global _store
+    with _lock:
+        _store = None
+
+
+if __name__ == "__main__":
+    store = districts()
+    print(f"{len(store.utm)} districts cached in EPSG:{UTM32} and EPSG:{WGS84} under {data_cache.CACHE_DIR}")
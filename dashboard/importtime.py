@@ -0,0 +1,87 @@
+"""
+Import-time report for the dashboard entry point.
+
+Runs `python -X importtime -c "import asgi"` in a fresh interpreter (this also builds
+the express UI from app.py, i.e. everything a worker does before the first session),
+prints the slowest top-level imports and fails if the total exceeds the budget or if
+a library that should load lazily shows up at startup. The fastest of --repeat runs
+counts: single runs vary by half a second with the load of the machine.
+
+    python importtime.py                 # default budget
+    python importtime.py --budget 2.5    # seconds
+"""
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+DASHBOARD_DIR = Path(__file__).resolve().parent
+ENTRY_MODULE = "asgi"
+BUDGET_SECONDS = float(os.environ.get("DASHBOARD_IMPORT_BUDGET", "4.0"))
+REPEAT = 3
+
+# must not be imported before the output that needs them renders
+DEFERRED = ("matplotlib", "geopandas", "plotly.graph_objects", "ipyleaflet", "seaborn", "folium")
+
+
+def measure(module=ENTRY_MODULE):
+    """Returns {module: (self_us, cumulative_us, depth)} from -X importtime."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=DASHBOARD_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr[-4000:])
+        raise SystemExit(f"import {module} failed")
+
+    timings = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        left, cumulative_us, raw_name = line.split("|")
+        depth = (len(raw_name) - len(raw_name.lstrip()) - 1) // 2
+        timings[raw_name.strip()] = (int(left.split(":")[1]), int(cumulative_us), depth)
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--budget", type=float, default=BUDGET_SECONDS, help="seconds")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="runs, the fastest counts")
+    args = parser.parse_args(argv)
+
+    runs = [measure() for _ in range(max(args.repeat, 1))]
+    startups = [sum(v[1] for v in timings.values() if v[2] == 0) / 1e6 for timings in runs]
+    startup = min(startups)
+    timings = runs[startups.index(startup)]
+    total = timings[ENTRY_MODULE][1] / 1e6 if ENTRY_MODULE in timings else 0.0
+
+    # per top-level package: cumulative time of its outermost import
+    packages = {}
+    for name, (_, cumulative, _) in timings.items():
+        root = name.split(".")[0]
+        if root != ENTRY_MODULE:
+            packages[root] = max(packages.get(root, 0), cumulative)
+
+    print(f"{'cumulative [ms]':>16}  package")
+    for name, cumulative in sorted(packages.items(), key=lambda kv: -kv[1])[:args.top]:
+        print(f"{cumulative / 1000:16.1f}  {name}")
+    print(f"\nimport {ENTRY_MODULE}: {total:.2f} s, all top-level imports: {startup:.2f} s, budget: {args.budget:.2f} s")
+
+    failed = False
+    eager = [m for m in DEFERRED if m in timings]
+    if eager:
+        print(f"FAIL: loaded at startup but should be lazy: {', '.join(eager)}")
+        failed = True
+    if startup > args.budget:
+        print("FAIL: import-time budget exceeded")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
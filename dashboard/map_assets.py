@@ -0,0 +1,155 @@
+import gzip
+import hashlib
+import importlib.util
+import logging
+import mimetypes
+import os
+import threading
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from starlette.responses import PlainTextResponse, Response
+
+import data_cache
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is always available
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+INPUT_DIR = data_cache.INPUT_DIR
+
+MAP_PATHS = {
+    "btn_stadt":  INPUT_DIR / "Stadtteil.html",
+    "btn_lage":   INPUT_DIR / "Pkte_Lage.html",
+    "btn_kita":   INPUT_DIR / "Pkte_Kita.html",
+    "btn_schule": INPUT_DIR / "Pkte_Schule.html",
+    "btn_arzt":   INPUT_DIR / "Pkte_Arzt.html",
+    "btn_opnv":   INPUT_DIR / "Pkte_Oepnv.html",
+}
+
+# Other static files served the same way under /assets/{name}
+STATIC_PATHS = {
+    "plotly.min.js": Path(importlib.util.find_spec("plotly").origin).parent / "package_data" / "plotly.min.js",
+}
+
+# Versioned URLs (?v=<etag>) never change content, so the browser may keep them for a year.
+# Unversioned requests are revalidated via ETag on each use.
+CACHE_IMMUTABLE = "public, max-age=31536000, immutable"
+CACHE_REVALIDATE = "no-cache"
+
+
+class MapAsset(NamedTuple):
+    mtime_ns: int
+    size: int
+    etag: str
+    raw: bytes
+    gz: bytes
+    br: Optional[bytes]
+
+
+_assets = {}
+_lock = threading.Lock()
+
+
+def _load(key, path):
+    st = os.stat(path)
+    asset = _assets.get(key)
+    if asset is not None and asset.mtime_ns == st.st_mtime_ns and asset.size == st.st_size:
+        return asset
+
+    with _lock:
+        asset = _assets.get(key)
+        if asset is not None and asset.mtime_ns == st.st_mtime_ns and asset.size == st.st_size:
+            return asset
+        raw = Path(path).read_bytes()
+        asset = MapAsset(
+            mtime_ns=st.st_mtime_ns,
+            size=st.st_size,
+            etag='"' + hashlib.sha1(raw).hexdigest()[:16] + '"',
+            raw=raw,
+            gz=gzip.compress(raw, compresslevel=9),
+            br=brotli.compress(raw) if brotli is not None else None,
+        )
+        _assets[key] = asset
+        logger.info("Asset %s loaded: %d bytes, gzip %d bytes", key, len(raw), len(asset.gz))
+        return asset
+
+
+def get_asset(key):
+    """
+    Cached, precompressed map layer for a MAP_PATHS key.
+    The file is only read again when its mtime or size changes.
+    Raises KeyError for unknown keys and FileNotFoundError for missing files.
+    """
+    return _load(key, MAP_PATHS[key])
+
+
+def get_static(name):
+    """Same as get_asset() for a STATIC_PATHS file."""
+    return _load(name, STATIC_PATHS[name])
+
+
+def url(key):
+    """Relative, content-versioned URL of a map layer (for an iframe src)."""
+    version = get_asset(key).etag.strip('"')
+    return f"maps/{key}?v={version}"
+
+
+def static_url(name):
+    """
+    Relative, content-versioned URL of a STATIC_PATHS file. The version is a path
+    segment, so the URL still ends in the file name (plotly's include_plotlyjs needs ".js").
+    """
+    version = get_static(name).etag.strip('"')
+    return f"assets/{version}/{name}"
+
+
+def _accepts(request, encoding):
+    accept = request.headers.get("accept-encoding", "")
+    return any(part.split(";")[0].strip() == encoding for part in accept.split(","))
+
+
+def _respond(request, asset, media_type, version):
+    versioned = version == asset.etag.strip('"')
+    headers = {
+        "ETag": asset.etag,
+        "Cache-Control": CACHE_IMMUTABLE if versioned else CACHE_REVALIDATE,
+        "Vary": "Accept-Encoding",
+    }
+    if request.headers.get("if-none-match") == asset.etag:
+        return Response(status_code=304, headers=headers)
+
+    body = asset.raw
+    if asset.br is not None and _accepts(request, "br"):
+        body = asset.br
+        headers["Content-Encoding"] = "br"
+    elif _accepts(request, "gzip"):
+        body = asset.gz
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, media_type=media_type, headers=headers)
+
+
+async def serve_map(request):
+    """Starlette endpoint for /maps/{key} with ETag, Cache-Control and precompressed bodies."""
+    key = request.path_params["key"]
+    try:
+        asset = get_asset(key)
+    except KeyError:
+        return PlainTextResponse(f"Unknown map '{key}'", status_code=404)
+    except FileNotFoundError:
+        return PlainTextResponse(f"File not found: {MAP_PATHS[key].name}", status_code=404)
+    return _respond(request, asset, "text/html; charset=utf-8", request.query_params.get("v"))
+
+
+async def serve_static(request):
+    """Starlette endpoint for /assets/[{version}/]{name}, same caching as serve_map()."""
+    name = request.path_params["name"]
+    try:
+        asset = get_static(name)
+    except (KeyError, FileNotFoundError):
+        return PlainTextResponse(f"Unknown asset '{name}'", status_code=404)
+    media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    return _respond(request, asset, media_type, request.path_params.get("version"))
@@ -0,0 +1,153 @@
+import os
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import data_cache
+import frequency_index
+import population_cube
+
+# Streaming ingestion of the resident microdata (KOSIS extract, data/k5000.csv).
+# The file is read in chunks of CHUNK_ROWS with an explicit schema: only the columns
+# in SCHEMA, ages as uint8, sex and residence codes as int8, text columns as
+# categoricals. Every chunk is folded into the PopulationCube and the frequency index of
+# the categorical columns (frequency_index.py) and dropped, so peak memory follows the
+# chunk size, not the file size. Both are stored in one .npz under .cache/ keyed by the
+# file's fingerprint, so later starts skip the read.
+#
+#   python microdata.py [path]      # memory report: inferred vs typed dtypes, peak of the stream
+
+CHUNK_ROWS = int(os.environ.get("DASHBOARD_CHUNK_ROWS", "250000"))
+CACHE_FORMAT = 2   # bump when the schema or the cube layout changes
+
+# nullable integer types: a missing value stays missing instead of turning the column into float
+SCHEMA = {
+    "einAlter": "UInt8",
+    "Geschlecht": "Int8",
+    "einWohnsitzart": "Int8",
+    "Stadtteil": "category",
+    "einStadtteil": "category",
+    "Religion": "category",
+    "Familienstand": "category",
+    "Staatsangehörigkeit": "category",
+}
+_INT_RANGE = {t: (np.iinfo(t.lower()).min, np.iinfo(t.lower()).max) for t in ("UInt8", "Int8")}
+CUBE_COLUMNS = ("einAlter", "Geschlecht", "einWohnsitzart", *population_cube.DISTRICT_COLUMNS)
+CATEGORY_COLUMNS = ("Familienstand", "Religion", "Staatsangehörigkeit")
+
+
+def _columns(path):
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def read_chunks(path, columns=None, chunk_rows=CHUNK_ROWS):
+    """Typed chunks of the file; columns: subset of SCHEMA to read (default: all present)."""
+    wanted = SCHEMA if columns is None else columns
+    usecols = [c for c in _columns(path) if c in wanted]
+    dtype = {c: SCHEMA[c] for c in usecols if c in SCHEMA}
+    # the C parser reads nullable integers through Python strings; float32 is parsed
+    # natively and cast per chunk, several times faster
+    parse = {c: "float32" if t in ("UInt8", "Int8") else t for c, t in dtype.items()}
+    ints = {c: t for c, t in dtype.items() if t in ("UInt8", "Int8")}
+    with pd.read_csv(path, usecols=usecols, dtype=parse, chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            # codes the narrow type cannot hold (e.g. an age of 300, a fractional code)
+            # count as missing instead of failing the cast and the whole load
+            for c, t in ints.items():
+                lo, hi = _INT_RANGE[t]
+                v = chunk[c]
+                chunk[c] = v.where(v.between(lo, hi) & (v == v.round()))
+            yield chunk.astype(ints)
+
+
+def _cube_path(path):
+    digest = data_cache.fingerprint(path, reader="microdata", fmt=CACHE_FORMAT, schema=SCHEMA)
+    return data_cache.CACHE_DIR / f"{path.stem}-cube-{digest}.npz"
+
+
+def _fold(path, chunk_rows=CHUNK_ROWS):
+    """(cube, frequency index) in one pass over the file."""
+    builder = frequency_index.Builder(CATEGORY_COLUMNS)
+
+    def tap(chunks):
+        for chunk in chunks:
+            builder.add(chunk)
+            yield chunk
+
+    cube = population_cube.from_microdata_chunks(tap(read_chunks(path, CUBE_COLUMNS + CATEGORY_COLUMNS, chunk_rows)))
+    return cube, builder.build()
+
+
+def _load(path):
+    cached = _cube_path(path)
+    if cached.exists():
+        with np.load(cached) as data:
+            cube = population_cube.PopulationCube(data["counts"], list(data["districts"]),
+                                                  bool(data["has_districts"]))
+            labels = iter(data["freq_labels"].tolist())
+            categories = {col: [next(labels) for _ in range(n)]
+                          for col, n in zip(data["freq_columns"].tolist(), data["freq_sizes"].tolist())}
+            freq = frequency_index.FrequencyIndex(data["freq_counts"], list(data["freq_districts"]),
+                                                  bool(data["freq_has_districts"]), categories)
+        return cube, freq
+    cube, freq = _fold(path)
+    cached.parent.mkdir(parents=True, exist_ok=True)
+    tmp = cached.with_name(f".{cached.stem}.{os.getpid()}.npz")
+    np.savez(
+        tmp, counts=cube.counts, districts=np.array(cube.districts), has_districts=cube.has_districts,
+        freq_counts=freq.counts, freq_districts=np.array(freq.districts), freq_has_districts=freq.has_districts,
+        freq_columns=np.array(freq.columns, dtype=str),
+        freq_sizes=np.array([len(v) for v in freq.categories.values()], dtype=np.int64),
+        freq_labels=np.array([label for v in freq.categories.values() for label in v], dtype=str),
+    )
+    os.replace(tmp, cached)
+    return cube, freq
+
+
+def load_cube(path):
+    """PopulationCube of the microdata file, folded chunk by chunk (cached as .npz)."""
+    return _load(path)[0]
+
+
+def load_frequencies(path):
+    """FrequencyIndex of CATEGORY_COLUMNS, folded in the same pass as the cube."""
+    return _load(path)[1]
+
+
+def memory_report(path, chunk_rows=CHUNK_ROWS):
+    """
+    Bytes per row of the first chunk with inferred vs. SCHEMA dtypes, and time and
+    traced peak memory of folding the whole file into the cube and frequency index.
+    """
+    inferred = pd.read_csv(path, nrows=chunk_rows)
+    typed = next(read_chunks(path, chunk_rows=chunk_rows))
+    n = max(len(inferred), 1)
+    tracemalloc.start()
+    start = time.perf_counter()
+    cube, freq = _fold(path, chunk_rows)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rows = int(cube.counts.sum())
+    return {
+        "rows": rows,
+        "inferred_bytes_per_row": inferred.memory_usage(deep=True).sum() / n,
+        "typed_bytes_per_row": typed.memory_usage(deep=True).sum() / n,
+        "stream_peak_bytes": peak,
+        "stream_seconds": seconds,
+        "cube_bytes": cube.counts.nbytes + freq.counts.nbytes,
+    }
+
+
+if __name__ == "__main__":
+    source = Path(sys.argv[1]) if len(sys.argv) > 1 else data_cache.ROOT_DIR / "data" / "k5000.csv"
+    r = memory_report(source)
+    mb = 1024 * 1024
+    print(f"{source}: {r['rows']:,} rows, chunks of {CHUNK_ROWS:,}")
+    print(f"  inferred dtypes   {r['inferred_bytes_per_row']:8.1f} B/row  -> {r['inferred_bytes_per_row'] * r['rows'] / mb:9.1f} MB as one frame")
+    print(f"  SCHEMA dtypes     {r['typed_bytes_per_row']:8.1f} B/row  -> {r['typed_bytes_per_row'] * r['rows'] / mb:9.1f} MB as one frame")
+    print(f"  streamed to cube  peak {r['stream_peak_bytes'] / mb:.1f} MB, cube + index {r['cube_bytes'] / mb:.2f} MB, {r['stream_seconds']:.2f} s")
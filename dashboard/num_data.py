@@ -1,38 +1,105 @@
+import math
+from collections import OrderedDict
+from typing import NamedTuple
+
+import population_cube
+import shared_cache
+
+
+class Kpis(NamedTuple):
+    total: int                  # alle Personen der Auswahl
+    main_household: int         # Hauptwohnsitz (Code: 40)
+    secondary_household: int    # Nebenwohnsitz (Code: 20)
+    male: int                   # Geschlecht 1
+    female: int                 # Geschlecht 2
+    average_age: float          # NaN, wenn kein gültiges Alter vorhanden
+
+
+_MAX_CUBES = 8
+_cubes = OrderedDict()   # id(df) -> (df, cube); the df reference keeps the id from being reused
+
+
+def _cube_for(df):
+    entry = _cubes.get(id(df))
+    if entry is not None and entry[0] is df:
+        _cubes.move_to_end(id(df))
+        return entry[1]
+    cube = population_cube.from_microdata(df)
+    _cubes[id(df)] = (df, cube)
+    if len(_cubes) > _MAX_CUBES:
+        _cubes.popitem(last=False)
+    return cube
+
+
+def forget(df):
+    """Drops the cube of a replaced frame and its shared results (datasets.reload)."""
+    entry = _cubes.pop(id(df), None)
+    if entry is not None and entry[0] is df:
+        shared_cache.invalidate(entry[1].version)
+
+
+def compute_kpis(df, selection=None):
+    """
+    All KPIs of the microdata in one pass. df is the microdata frame, or the
+    population cube already folded from it (datasets.kos_cube). A frame is folded
+    once into a cube (per dataset version), so a selection is a sum over Stadtteile.
+    Results are shared per (dataset version, selection) through shared_cache, so the value
+    boxes of all sessions share them.
+    """
+    cube = df if isinstance(df, population_cube.PopulationCube) else _cube_for(df)
+    return shared_cache.cached("kpis", cube.version, cube.selection_index(selection),
+                               lambda: _kpis_of(cube, selection))
+
+
+def _kpis_of(cube, selection):
+    sub = cube.select(selection)                 # Alter × Geschlecht × Wohnsitzart
+    by_sex = sub.sum(axis=(0, 2))
+    by_residence = sub.sum(axis=(0, 1))
+    by_age = sub[:-1].sum(axis=(1, 2))           # without the "unknown age" slot
+    n_aged = by_age.sum()
+    avg = float(by_age @ cube.ages / n_aged) if n_aged else float("nan")
+
+    return Kpis(
+        total=int(sub.sum()),
+        main_household=int(by_residence[0]),
+        secondary_household=int(by_residence[1]),
+        male=int(by_sex[0]),
+        female=int(by_sex[1]),
+        average_age=avg,
+    )
+
+
 # Komplette Population | Done
 def num_population(df):
     return len(df)
 
 # Hauptwohnsitz (Code: 40) | Done
-def num_population_main_household(df):
-    total = df.shape[0]
-    if total == 0:
+def num_population_main_household(df, selection=None):
+    k = compute_kpis(df, selection)
+    if k.total == 0:
         return "Keine Daten"
-    m = df[df["einWohnsitzart"] == 40].shape[0]
-    return m
+    return k.main_household
 
 # Sekundärwohnsitz (Code: 20) | Done
-def num_population_secondary_household(df):
-    total = df.shape[0]
-    if total == 0:
+def num_population_secondary_household(df, selection=None):
+    k = compute_kpis(df, selection)
+    if k.total == 0:
         return "Keine Daten"
-    m = df[df["einWohnsitzart"] == 20].shape[0]
-    return m
+    return k.secondary_household
 
 # Männliche Population | Done
-def per_population_male(df):
-    total = df.shape[0]
-    if total == 0:
+def per_population_male(df, selection=None):
+    k = compute_kpis(df, selection)
+    if k.total == 0:
         return "Keine Daten"
-    m = df[df["Geschlecht"] == 1].shape[0]
-    return f"{(m / total * 100):.1f} %"
+    return f"{(k.male / k.total * 100):.1f} %"
 
 # Weibliche Population |  Done
-def per_population_female(df):
-    total = df.shape[0]
-    if total == 0:
+def per_population_female(df, selection=None):
+    k = compute_kpis(df, selection)
+    if k.total == 0:
         return "Keine Daten"
-    w = df[df["Geschlecht"] == 2].shape[0]
-    return f"{(w / total * 100):.1f} %"
+    return f"{(k.female / k.total * 100):.1f} %"
 
 # Eingezogen | Done
 def num_population_moved_in(df):
@@ -47,8 +114,11 @@ def diff_population_moved(df):
     return "Daten benötigt"
 
 # Altersdurchschnitt | Done
-def num_population_average_age(df):
-    return round(df["einAlter"].mean(), 2)
+def num_population_average_age(df, selection=None):
+    average_age = compute_kpis(df, selection).average_age
+    if math.isnan(average_age):
+        return "Keine Daten"
+    return round(average_age, 2)
 
 # Geburten | Daten benötigt
 def num_population_births(df):
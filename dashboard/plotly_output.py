@@ -0,0 +1,103 @@
+import numpy as np
+
+import map_assets
+
+# Plotly figures as plain HTML outputs instead of plotly FigureWidgets.
+# A FigureWidget ships the whole plotly.js bundle (~5 MB) in its comm_open, once per
+# widget and session. Here plotly.js is loaded once per page from the versioned /assets
+# route (map_assets.py, cached by the browser), each figure is a small HTML fragment,
+# and later changes are patched on the client with Plotly.restyle (custom message).
+#
+#   ui.head_content(plotly_output.head())            plotly.js + restyle handler
+#
+#   @render.ui                                       initial figure (under isolate)
+#   def alterspyramide():
+#       return ui.HTML(plotly_output.html(fig, "alterspyramide"))
+#
+#   @reactive.effect                                  only the changed arrays
+#   async def _update():
+#       await plotly_output.restyle("alterspyramide", {"x": [men, women]}, ["Männer", "Frauen"])
+
+MESSAGE = "plotly_restyle"
+DEFAULT_HEIGHT = 450
+
+# Registered once per page (app.py). traces are indices or trace names; a message for a
+# plot that is not (yet) on the page is dropped: the next render already has the data.
+CLIENT_JS = """
+document.addEventListener("DOMContentLoaded", function () {
+  Shiny.addCustomMessageHandler("%s", function (msg) {
+    var el = document.getElementById(msg.id);
+    if (!el || !window.Plotly || !el.data) return;
+    var traces = msg.traces.map(function (t) {
+      return typeof t === "number" ? t : el.data.findIndex(function (d) { return d.name === t; });
+    });
+    var keep = traces.map(function (t) { return t >= 0 && t < el.data.length; });
+    var update = {};
+    Object.keys(msg.update).forEach(function (key) {
+      update[key] = msg.update[key].filter(function (_, i) { return keep[i]; });
+    });
+    traces = traces.filter(function (_, i) { return keep[i]; });
+    if (traces.length) Plotly.restyle(el, update, traces);
+  });
+});
+""" % MESSAGE
+
+
+def div_id(output_id):
+    return f"{output_id}-plotly"
+
+
+def head():
+    """Head tags of the page: plotly.js from /assets and the restyle handler."""
+    from shiny import ui
+
+    return ui.TagList(
+        ui.tags.script(src=map_assets.static_url("plotly.min.js"), charset="utf-8"),
+        ui.tags.script(CLIENT_JS),
+    )
+
+
+def html(fig, output_id):
+    """HTML fragment of fig for the output output_id (plotly.js comes with head())."""
+    from plotly.io import to_html
+
+    height = fig.layout.height or DEFAULT_HEIGHT
+    return to_html(
+        fig,
+        include_plotlyjs=False,
+        full_html=False,
+        div_id=div_id(output_id),
+        default_height=f"{height}px",
+        config={"responsive": True},
+    )
+
+
+def _plain(value):
+    # json.dumps of the session cannot encode numpy arrays / pandas objects
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    if hasattr(value, "tolist"):
+        return np.asarray(value).tolist()
+    return value
+
+
+def restyle_message(output_id, update, traces):
+    """
+    update: attribute -> one value per trace (e.g. {"x": [men, women]}),
+    traces: trace indices or names in the same order.
+    """
+    return {
+        "id": div_id(output_id),
+        "update": {key: [_plain(v) for v in values] for key, values in update.items()},
+        "traces": list(traces),
+    }
+
+
+async def restyle(output_id, update, traces=(0,), session=None):
+    """Sends a Plotly.restyle of the plot of output_id to the client of the session."""
+    if session is None:
+        from shiny.session import get_current_session
+
+        session = get_current_session()
+    if session is not None:
+        await session.send_custom_message(MESSAGE, restyle_message(output_id, update, traces))
@@ -0,0 +1,219 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+# Dense population cube: Stadtteil × Alter × Geschlecht × Wohnsitzart.
+# Built once at load time; any district selection is a sum over axis 0.
+
+SEX_CODES = (1, 2)             # 1 = männlich, 2 = weiblich
+RESIDENCE_CODES = (40, 20)     # 40 = Hauptwohnsitz, 20 = Nebenwohnsitz
+DISTRICT_COLUMNS = ("Stadtteil", "einStadtteil")
+ALL_DISTRICTS = "Gesamt"
+UNKNOWN_DISTRICT = "unbekannt"
+
+_versions = itertools.count(1)
+
+
+def next_version():
+    """Unique build id, shared with other aggregates so cache keys never collide."""
+    return next(_versions)
+
+
+class PopulationCube:
+    """
+    counts: int64 array of shape (Stadtteile, Alter + 1, 3, 3).
+            The last slot of the age, sex and residence axes collects
+            missing / unknown codes, so totals always match the row count.
+    districts: district labels along axis 0
+    version: unique id of this build, used as cache key by consumers
+    """
+
+    def __init__(self, counts, districts, has_districts):
+        self.counts = counts
+        self.districts = tuple(districts)
+        self.has_districts = has_districts
+        self.ages = np.arange(counts.shape[1] - 1)
+        self.version = next_version()
+        self._index = {name: i for i, name in enumerate(self.districts)}
+        self._total = counts.sum(axis=0)
+
+    def selection_index(self, selection=None):
+        # None (or a cube without districts) means "all rows", like the old filter
+        if selection is None or not self.has_districts:
+            return None
+        return tuple(sorted({self._index[s] for s in selection if s in self._index}))
+
+    def select(self, selection=None):
+        """Alter × Geschlecht × Wohnsitzart counts summed over the selected Stadtteile."""
+        idx = self.selection_index(selection)
+        if idx is None:
+            return self._total
+        return self.counts[list(idx)].sum(axis=0)
+
+    def pyramid(self, selection=None):
+        """Returns (ages, Männer, Frauen) over all residence types."""
+        sub = self.select(selection)[:-1]
+        men = sub[:, 0, :].sum(axis=1)
+        women = sub[:, 1, :].sum(axis=1)
+        return self.ages, men, women
+
+
+def _district_column(df):
+    for col in DISTRICT_COLUMNS:
+        if col in df.columns:
+            return col
+    return None
+
+
+def _district_codes(df):
+    col = _district_column(df)
+    if col is None:
+        return np.zeros(len(df), dtype=np.intp), [ALL_DISTRICTS], False
+
+    values = df[col].astype("string")
+    cat = pd.Categorical(values.dropna(), categories=sorted(values.dropna().unique()))
+    districts = list(cat.categories)
+    codes = np.full(len(df), len(districts), dtype=np.intp)
+    codes[values.notna().to_numpy()] = cat.codes
+    if values.isna().any():
+        districts.append(UNKNOWN_DISTRICT)
+    return codes, districts, True
+
+
+def _age_codes(values, max_age=None):
+    a = pd.to_numeric(values, errors="coerce").to_numpy(dtype=float)
+    valid = np.isfinite(a) & (a >= 0)
+    ages = np.where(valid, np.floor(np.where(valid, a, 0)), 0).astype(np.intp)
+    if max_age is None:
+        max_age = int(ages[valid].max()) if valid.any() else 0
+    valid &= ages <= max_age
+    n_ages = max_age + 1
+    return np.where(valid, ages, n_ages), n_ages
+
+
+def _slot_codes(values, codes):
+    # map known codes to 0..n-1, everything else to the trailing "sonstige" slot
+    v = pd.to_numeric(values, errors="coerce").to_numpy(dtype=float)
+    out = np.full(len(v), len(codes), dtype=np.intp)
+    for i, code in enumerate(codes):
+        out[v == code] = i
+    return out
+
+
+def _fold(d, a, s, r, n_districts, n_ages, weights=None):
+    shape = (n_districts, n_ages + 1, len(SEX_CODES) + 1, len(RESIDENCE_CODES) + 1)
+    flat = np.ravel_multi_index((d, a, s, r), shape)
+    counts = np.bincount(flat, weights=weights, minlength=int(np.prod(shape)))
+    if weights is not None:
+        counts = np.rint(counts)
+    return counts.astype(np.int64).reshape(shape)
+
+
+def from_microdata(df, age_col="einAlter", sex_col="Geschlecht",
+                   residence_col="einWohnsitzart", max_age=None):
+    """Cube from one row per resident (KOSIS extract, e.g. data/k5000.csv)."""
+    d, districts, has_districts = _district_codes(df)
+    a, n_ages = _age_codes(df[age_col], max_age)
+    s = _slot_codes(df[sex_col], SEX_CODES)
+    if residence_col in df.columns:
+        r = _slot_codes(df[residence_col], RESIDENCE_CODES)
+    else:
+        r = np.full(len(df), len(RESIDENCE_CODES), dtype=np.intp)
+    return PopulationCube(_fold(d, a, s, r, len(districts), n_ages), districts, has_districts)
+
+
+class DistrictSlots:
+    """
+    Rows for district labels that stay stable across chunks (in order of appearance),
+    for aggregates folded from a stream (from_microdata_chunks, frequency_index.py).
+    """
+
+    def __init__(self):
+        self.slots = {}          # district label -> row
+        self.has_districts = False
+
+    def __len__(self):
+        return len(self.slots)
+
+    def codes(self, df):
+        """Row of every record of the chunk; missing districts go to "unbekannt"."""
+        col = _district_column(df)
+        if col is None:
+            codes, labels = np.zeros(len(df), dtype=np.intp), [ALL_DISTRICTS]
+        else:
+            self.has_districts = True
+            codes, uniques = pd.factorize(df[col])
+            labels = [*map(str, uniques), UNKNOWN_DISTRICT]
+            codes = np.where(codes < 0, len(uniques), codes)
+        return np.array([self.slots.setdefault(label, len(self.slots)) for label in labels], dtype=np.intp)[codes]
+
+    def order(self, counts):
+        """(labels, rows) in the layout of from_microdata: sorted, "unbekannt" last if used."""
+        if not self.has_districts:
+            return [ALL_DISTRICTS], [self.slots[ALL_DISTRICTS]]
+        labels = sorted(label for label in self.slots if label != UNKNOWN_DISTRICT)
+        if counts[self.slots[UNKNOWN_DISTRICT]].any():
+            labels.append(UNKNOWN_DISTRICT)
+        return labels, [self.slots[label] for label in labels]
+
+
+def from_microdata_chunks(chunks, age_col="einAlter", sex_col="Geschlecht",
+                          residence_col="einWohnsitzart", max_age=255):
+    """
+    Cube from microdata read in chunks (see microdata.py): every chunk is folded into
+    the counts and dropped, so memory stays at one chunk plus the cube. The result
+    equals from_microdata() over the concatenated frame (ages above max_age excepted).
+    """
+    slots = DistrictSlots()
+    counts = None
+    n_ages = max_age + 1
+    for df in chunks:
+        d = slots.codes(df)
+        a, _ = _age_codes(df[age_col], max_age)
+        s = _slot_codes(df[sex_col], SEX_CODES)
+        if residence_col in df.columns:
+            r = _slot_codes(df[residence_col], RESIDENCE_CODES)
+        else:
+            r = np.full(len(df), len(RESIDENCE_CODES), dtype=np.intp)
+        part = _fold(d, a, s, r, len(slots), n_ages)
+        if counts is not None:
+            part[:len(counts)] += counts
+        counts = part
+
+    if counts is None:
+        return from_microdata(pd.DataFrame({age_col: [], sex_col: []}))
+    # ages up to the oldest, like from_microdata
+    labels, rows = slots.order(counts)
+    counts = counts[rows]
+    aged = np.flatnonzero(counts[:, :n_ages].any(axis=(0, 2, 3)))
+    top = int(aged[-1]) + 1 if len(aged) else 1
+    counts = np.concatenate([counts[:, :top], counts[:, n_ages:]], axis=1)
+    return PopulationCube(counts, labels, slots.has_districts)
+
+
+def from_table(df, age_col="Alter", men_col="Männer", women_col="Frauen",
+               residence=40, max_age=None):
+    """
+    Cube from an aggregated age table (Alter / Männer / Frauen, optional Stadtteil),
+    e.g. Input/2022.xlsx. Rows without a numeric age are dropped like in a groupby.
+    All counts are booked on one residence type (default: Hauptwohnsitz).
+    """
+    age = pd.to_numeric(df[age_col], errors="coerce")
+    df = df[age.notna()]
+    d, districts, has_districts = _district_codes(df)
+    a, n_ages = _age_codes(df[age_col], max_age)
+    r_slot = RESIDENCE_CODES.index(residence) if residence in RESIDENCE_CODES else len(RESIDENCE_CODES)
+
+    n = len(df)
+    men = pd.to_numeric(df[men_col], errors="coerce").fillna(0).to_numpy(dtype=float)
+    women = pd.to_numeric(df[women_col], errors="coerce").fillna(0).to_numpy(dtype=float)
+    counts = _fold(
+        np.concatenate([d, d]),
+        np.concatenate([a, a]),
+        np.repeat(np.arange(2, dtype=np.intp), n),
+        np.full(2 * n, r_slot, dtype=np.intp),
+        len(districts), n_ages,
+        weights=np.concatenate([men, women]),
+    )
+    return PopulationCube(counts, districts, has_districts)
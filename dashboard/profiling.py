@@ -0,0 +1,261 @@
+import bisect
+import json
+import os
+import re
+import threading
+import time
+from functools import wraps
+
+# Built-in instrumentation for app.py.
+#   @profiling.output / @profiling.calc   latency histogram and invalidation count per
+#                                         render function / reactive calc
+#   profiling.count_payload(app)          ASGI middleware (asgi.py): payload bytes sent
+#                                         per output over the session websockets
+#   profiling.track_session(session)      optional trace of the session
+# Metrics are process-wide and exported in Prometheus text format on /metrics (asgi.py).
+# With DASHBOARD_TRACE=1 every session writes a Chrome trace-event file (one complete
+# event per render / calc, open in chrome://tracing or speedscope for a flame view)
+# to .cache/traces/ when it ends.
+# asgi.py imports this module at startup: data_cache (and with it pandas) is imported
+# where the trace is written.
+#
+# Payload bytes are read from the websocket frames, below shiny: every frame with
+# "values" or "custom" is attributed to its outputs, no shiny internals are patched.
+# Widget traffic (shinywidgets_comm_open / comm_msg custom messages) is attributed to
+# the render_widget output through the widget model ids: the output value carries the
+# model id of its widget, and the state of a widget references its child widgets
+# (e.g. the layers of a map) as "IPY_MODEL_<id>". The comm message format is the one
+# of shinywidgets 0.8.1 (pinned in requirements.txt); other messages are still counted
+# under their custom message type.
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TRACE = os.environ.get("DASHBOARD_TRACE", "0") == "1"
+
+_lock = threading.Lock()
+_histograms = {}       # (kind, name) -> [bucket counts..., +Inf count, sum]
+_invalidations = {}    # (kind, name) -> count
+_payload = {}          # output id -> bytes sent
+_WIDGET_MESSAGES = ("shinywidgets_comm_open", "shinywidgets_comm_msg", "shinywidgets_comm_close")
+_MODEL_REF = re.compile(r"IPY_MODEL_([0-9a-f]+)")
+_traces = {}           # session id -> list of trace events
+_T0 = time.perf_counter()
+
+
+def _observe(kind, name, seconds):
+    with _lock:
+        h = _histograms.get((kind, name))
+        if h is None:
+            h = _histograms[(kind, name)] = [0] * (len(BUCKETS) + 2)
+        h[bisect.bisect_left(BUCKETS, seconds)] += 1
+        h[-1] += seconds
+
+
+def _count_invalidation(kind, name):
+    with _lock:
+        _invalidations[(kind, name)] = _invalidations.get((kind, name), 0) + 1
+
+
+def _session_id():
+    from shiny.session import get_current_session
+
+    session = get_current_session()
+    return getattr(session, "id", None)
+
+
+def _instrument(kind):
+    def decorator(fn):
+        name = fn.__name__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            from shiny.reactive import get_current_context
+
+            try:
+                get_current_context().on_invalidate(lambda: _count_invalidation(kind, name))
+            except RuntimeError:
+                pass                              # called outside a reactive context
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                end = time.perf_counter()
+                _observe(kind, name, end - start)
+                if TRACE:
+                    _trace(name, kind, start, end)
+
+        return wrapper
+
+    return decorator
+
+
+output = _instrument("output")
+calc = _instrument("calc")
+
+
+def _trace(name, kind, start, end):
+    sid = _session_id()
+    if sid is None:
+        return
+    event = {"name": name, "cat": kind, "ph": "X", "pid": os.getpid(), "tid": sid,
+             "ts": (start - _T0) * 1e6, "dur": (end - start) * 1e6}
+    with _lock:
+        _traces.setdefault(sid, []).append(event)
+
+
+def _dump_trace(sid):
+    with _lock:
+        events = _traces.pop(sid, None)
+    if not events:
+        return
+    import data_cache
+
+    trace_dir = data_cache.CACHE_DIR / "traces"
+    trace_dir.mkdir(parents=True, exist_ok=True)
+    path = trace_dir / f"session-{sid}.json"
+    path.write_text(json.dumps({"traceEvents": events}), encoding="utf-8")
+
+
+class _WidgetOwners:
+    """Model id -> output id for the widgets of one session; bytes wait until the owner is known."""
+
+    def __init__(self):
+        self.parent = {}       # model id -> parent model id, or ("output", output id)
+        self.pending = {}      # model id -> bytes sent before its output was known
+
+    def output_of(self, model_id):
+        seen = set()
+        while model_id in self.parent and model_id not in seen:
+            seen.add(model_id)
+            owner = self.parent[model_id]
+            if isinstance(owner, tuple):
+                return owner[1]
+            model_id = owner
+        return None
+
+    def message(self, text):
+        """Output id of a widget comm message (JSON text), or None while unknown."""
+        content = json.loads(text).get("content") or {}
+        model_id = content.get("comm_id")
+        for child in _MODEL_REF.findall(json.dumps(content.get("data"))):
+            self.parent.setdefault(child, model_id)
+        output_id = self.output_of(model_id)
+        if output_id is None:
+            self.pending[model_id] = self.pending.get(model_id, 0) + len(json.dumps(text))
+        return output_id
+
+    def rendered(self, output_id, model_id):
+        """Records the widget of an output; returns the bytes its models sent before."""
+        self.parent[model_id] = ("output", output_id)
+        done = [m for m in self.pending if self.output_of(m) == output_id]
+        return sum(self.pending.pop(m) for m in done)
+
+
+def _count_frame(text, widgets):
+    try:
+        message = json.loads(text)
+    except ValueError:
+        return
+    if not isinstance(message, dict):
+        return
+
+    def count(key, n):
+        _payload[key] = _payload.get(key, 0) + n
+
+    with _lock:
+        for key, value in (message.get("values") or {}).items():
+            count(key, len(json.dumps(value)))
+            if isinstance(value, dict) and "model_id" in value:      # render_widget output
+                count(key, widgets.rendered(key, value["model_id"]))
+        for kind, value in (message.get("custom") or {}).items():
+            if kind not in _WIDGET_MESSAGES or not isinstance(value, str):
+                count(f"custom:{kind}", len(json.dumps(value)))
+                continue
+            output_id = widgets.message(value)
+            if output_id is not None:
+                count(output_id, len(json.dumps(value)))
+
+
+def count_payload(app):
+    """ASGI middleware counting the bytes of every output value sent over a websocket."""
+
+    async def counted(scope, receive, send):
+        if scope["type"] != "websocket":
+            await app(scope, receive, send)
+            return
+        widgets = _WidgetOwners()                # one per connection, i.e. per session
+
+        async def counting_send(event):
+            if event["type"] == "websocket.send" and event.get("text"):
+                _count_frame(event["text"], widgets)
+            await send(event)
+
+        await app(scope, receive, counting_send)
+
+    return counted
+
+
+def track_session(session):
+    """Dumps the trace of this session when it ends (DASHBOARD_TRACE=1)."""
+    if session is None or session.is_stub_session():
+        return                                    # UI-only pass of express (no client)
+    if TRACE:
+        sid = session.id
+        session.on_ended(lambda: _dump_trace(sid))
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text(extra=None):
+    """All metrics in Prometheus text exposition format. extra: name -> gauge value."""
+    lines = [
+        "# HELP dashboard_reactive_seconds Latency of render functions and reactive calcs.",
+        "# TYPE dashboard_reactive_seconds histogram",
+    ]
+    with _lock:
+        histograms = {k: list(v) for k, v in _histograms.items()}
+        invalidations = dict(_invalidations)
+        payload = dict(_payload)
+    for (kind, name), h in sorted(histograms.items()):
+        labels = f'kind="{kind}",name="{_label(name)}"'
+        total = 0
+        for bound, n in zip(BUCKETS, h):
+            total += n
+            lines.append(f'dashboard_reactive_seconds_bucket{{{labels},le="{bound}"}} {total}')
+        total += h[len(BUCKETS)]
+        lines.append(f'dashboard_reactive_seconds_bucket{{{labels},le="+Inf"}} {total}')
+        lines.append(f"dashboard_reactive_seconds_sum{{{labels}}} {h[-1]:.6f}")
+        lines.append(f"dashboard_reactive_seconds_count{{{labels}}} {total}")
+
+    lines += ["# HELP dashboard_reactive_invalidations_total Invalidations per render function / calc.",
+              "# TYPE dashboard_reactive_invalidations_total counter"]
+    for (kind, name), n in sorted(invalidations.items()):
+        lines.append(f'dashboard_reactive_invalidations_total{{kind="{kind}",name="{_label(name)}"}} {n}')
+
+    lines += ["# HELP dashboard_output_payload_bytes_total JSON bytes sent to clients per output.",
+              "# TYPE dashboard_output_payload_bytes_total counter"]
+    for key, n in sorted(payload.items()):
+        lines.append(f'dashboard_output_payload_bytes_total{{output="{_label(key)}"}} {n}')
+
+    for name, value in (extra or {}).items():
+        lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
+
+
+async def serve_metrics(request):
+    """Starlette endpoint for /metrics; only answers local clients."""
+    from starlette.responses import PlainTextResponse
+
+    import data_watcher
+    import shared_cache
+    import warmup
+
+    host = request.client.host if request.client else ""
+    if host not in ("127.0.0.1", "::1") and os.environ.get("DASHBOARD_METRICS_PUBLIC") != "1":
+        return PlainTextResponse("Not Found", status_code=404)
+    extra = {f"dashboard_shared_cache_{k}": v for k, v in shared_cache.stats().items()}
+    if warmup.last_seconds is not None:
+        extra["dashboard_warmup_seconds"] = round(warmup.last_seconds, 3)
+    extra["dashboard_data_reloads"] = data_watcher.reloads
+    return PlainTextResponse(prometheus_text(extra), media_type="text/plain; version=0.0.4")
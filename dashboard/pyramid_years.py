@@ -0,0 +1,133 @@
+import threading
+from functools import lru_cache
+
+import numpy as np
+
+import data_cache
+import population_cube
+
+# Multi-year Alterspyramide (comparison / animation).
+# The age tables of all years are loaded once into one aligned array
+# counts[year, age, sex]; figures for a set of years are built in one vectorized
+# step and cached as HTML, so switching or playing years needs no server work later.
+
+YEARS = (1950, 2022, 2070)
+YEAR_COLORS = {1950: "#8c8c8c", 2022: "#1f77b4", 2070: "#d62728"}
+
+_data = None
+_lock = threading.Lock()
+
+
+def year_array():
+    """Returns (years, ages, counts) with counts of shape (year, age, 2) = Männer, Frauen."""
+    global _data
+    if _data is None:
+        with _lock:
+            if _data is None:
+                tables = [data_cache.read_excel(data_cache.INPUT_DIR / f"{y}.xlsx", coerce=data_cache.coerce_age_table) for y in YEARS]
+                max_age = int(max(t["Alter"].max() for t in tables))
+                cubes = [population_cube.from_table(t, max_age=max_age) for t in tables]
+                counts = np.stack([np.stack(c.pyramid()[1:], axis=-1) for c in cubes])
+                _data = (YEARS, cubes[0].ages, counts)
+    return _data
+
+
+def sources():
+    """Age tables of YEARS that exist in Input/."""
+    return [p for p in (data_cache.INPUT_DIR / f"{y}.xlsx" for y in YEARS) if p.exists()]
+
+
+def reset():
+    """Drops the year tables and the figures built from them (an age table changed)."""
+    global _data
+    with _lock:
+        _data = None
+    figure_html.cache_clear()
+
+
+def _select(years):
+    all_years, ages, counts = year_array()
+    idx = [all_years.index(y) for y in years]
+    x = counts[idx] / 1000                      # (year, age, sex) in Tsd.
+    return ages, x[..., 0] * -1, x[..., 1]      # Männer left, Frauen right
+
+
+def _layout(fig, x_max):
+    fig.update_layout(
+        barmode="overlay",
+        yaxis=dict(title="Alter in Jahren", range=[0, 100]),
+        xaxis=dict(title="Anzahl in Tsd.", range=[-x_max * 1.05, x_max * 1.05]),
+        bargap=0.1,
+        height=600,
+        margin=dict(t=30, b=40, l=10, r=10),
+    )
+
+
+def comparison_figure(years):
+    """Overlay of the selected years as step outlines (one colour per year)."""
+    import plotly.graph_objects as go
+
+    ages, men, women = _select(years)
+    fig = go.Figure()
+    for i, year in enumerate(years):
+        for label, x in (("Männer", men[i]), ("Frauen", women[i])):
+            fig.add_trace(go.Scatter(
+                x=x, y=ages, mode="lines", line_shape="hvh",
+                line=dict(color=YEAR_COLORS.get(year), width=1.5),
+                name=str(year), legendgroup=str(year), showlegend=label == "Männer",
+                hovertemplate=f"<b>{label} {year}</b><br>Alter: %{{y}}<br>Anzahl: %{{x}}<extra></extra>",
+            ))
+    _layout(fig, float(np.abs(men).max(initial=0) if men.size else 0) or 1)
+    return fig
+
+
+def animation_figure(years):
+    """Pyramid of the first year with one animation frame per selected year."""
+    import plotly.graph_objects as go
+
+    ages, men, women = _select(years)
+
+    def bars(i):
+        return [
+            go.Bar(y=ages, x=men[i], orientation="h", name="Männer", marker=dict(color="lightblue"),
+                   hovertemplate="<b>Männer</b><br>Alter: %{y}<br>Anzahl: %{x}<extra></extra>"),
+            go.Bar(y=ages, x=women[i], orientation="h", name="Frauen", marker=dict(color="pink"),
+                   hovertemplate="<b>Frauen</b><br>Alter: %{y}<br>Anzahl: %{x}<extra></extra>"),
+        ]
+
+    frames = [go.Frame(data=bars(i), name=str(y)) for i, y in enumerate(years)]
+    fig = go.Figure(data=bars(0), frames=frames)
+    step_args = dict(mode="immediate", frame=dict(duration=800, redraw=True), transition=dict(duration=400))
+    fig.update_layout(
+        updatemenus=[dict(
+            type="buttons", showactive=False, x=0, y=1.08, xanchor="left",
+            buttons=[dict(label="▶", method="animate", args=[None, dict(step_args, fromcurrent=True)])],
+        )],
+        sliders=[dict(
+            active=0, x=0.1, len=0.9, currentvalue=dict(prefix="Jahr: "),
+            steps=[dict(label=str(y), method="animate", args=[[str(y)], step_args]) for y in years],
+        )],
+    )
+    _layout(fig, float(max(np.abs(men).max(initial=0), women.max(initial=0))) or 1)
+    return fig
+
+
+@lru_cache(maxsize=32)
+def figure_html(mode, years):
+    """
+    Cached HTML fragment for mode "overlay" or "animation" and a tuple of years.
+    plotly.js itself is loaded once per page from the cached /assets route (plotly_output.head).
+    """
+    from plotly.io import to_html
+
+    years = tuple(y for y in YEARS if y in years)
+    if not years:
+        return "<p>Bitte mindestens ein Jahr auswählen.</p>"
+    fig = animation_figure(years) if mode == "animation" else comparison_figure(years)
+    return to_html(
+        fig,
+        include_plotlyjs=False,
+        full_html=False,
+        config={"responsive": True},
+        auto_play=False,
+    )
@@ -0,0 +1,116 @@
+import copy
+import os
+import time
+from functools import wraps
+
+from shiny import reactive
+
+# Rate limiting for reactive inputs (after the recipe in the shiny docs).
+# Both wrap a reactive function (e.g. input.city_districts) into a reactive.calc that
+# downstream outputs read instead. Values that are superseded inside the window never
+# reach them, so a burst of clicks causes one recomputation instead of one per click.
+#   debounce  fires once the input has been quiet for delay_secs
+#   throttle  fires at most once per delay_secs while the input keeps changing
+# Must be called inside a session (app.py runs per session).
+
+FILTER_DEBOUNCE_SECS = float(os.environ.get("DASHBOARD_FILTER_DEBOUNCE_MS", "300")) / 1000
+
+
+def debounce(delay_secs):
+    def wrapper(f):
+        when = reactive.Value(None)
+        trigger = reactive.Value(0)
+
+        @reactive.calc
+        def cached():
+            return copy.deepcopy(f())
+
+        initial = True
+
+        @reactive.effect(priority=102)
+        def _primer():
+            # every new value pushes the deadline back. The value at session start is
+            # served by debounced() on its first run and arms no timer, so the outputs
+            # do not render a second time once the delay has passed
+            nonlocal initial
+            try:
+                cached()
+            finally:
+                if initial:
+                    initial = False
+                else:
+                    when.set(time.time() + delay_secs)
+
+        @reactive.effect(priority=101)
+        def _timer():
+            deadline = when()
+            if deadline is None:
+                return
+            time_left = deadline - time.time()
+            if time_left <= 0:
+                with reactive.isolate():
+                    when.set(None)
+                    trigger.set(trigger() + 1)
+            else:
+                reactive.invalidate_later(time_left)
+
+        @reactive.calc
+        @reactive.event(trigger, ignore_none=False)
+        @wraps(f)
+        def debounced():
+            return cached()
+
+        return debounced
+
+    return wrapper
+
+
+def throttle(delay_secs):
+    def wrapper(f):
+        last_signaled = reactive.Value(None)
+        last_triggered = reactive.Value(None)
+        trigger = reactive.Value(0)
+
+        @reactive.calc
+        def cached():
+            return copy.deepcopy(f())
+
+        initial = True
+
+        @reactive.effect(priority=102)
+        def _primer():
+            # as in debounce: the value at session start needs no trigger
+            nonlocal initial
+            try:
+                cached()
+            finally:
+                with reactive.isolate():
+                    if initial:
+                        initial = False
+                        last_triggered.set(time.time())
+                    else:
+                        last_signaled.set(time.time())
+
+        @reactive.effect(priority=101)
+        def _timer():
+            if last_signaled() is None:
+                return
+            with reactive.isolate():
+                if last_triggered() is not None and last_signaled() <= last_triggered():
+                    return
+                time_left = (last_triggered() or 0) + delay_secs - time.time()
+                if time_left <= 0:
+                    last_triggered.set(time.time())
+                    trigger.set(trigger() + 1)
+                else:
+                    reactive.invalidate_later(time_left)
+
+        @reactive.calc
+        @reactive.event(trigger, ignore_none=False)
+        @wraps(f)
+        def throttled():
+            return cached()
+
+        return throttled
+
+    return wrapper
@@ -0,0 +1,127 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Process-wide result cache shared by all Shiny sessions.
+# @reactive.calc results are per session; the calcs in app.py (and num_data) consult
+# this cache first, keyed on (output id, dataset version, normalized selection), so
+# sessions with the same selection compute an aggregation once per process.
+# Entries are evicted least-recently-used beyond MAX_ENTRIES / MAX_BYTES and expire
+# after TTL_SECS. invalidate() drops everything (or one dataset version / output) on reload.
+
+MAX_ENTRIES = 1024
+MAX_BYTES = int(os.environ.get("DASHBOARD_SHARED_CACHE_MB", "256")) * 1024 * 1024
+TTL_SECS = float(os.environ.get("DASHBOARD_SHARED_CACHE_TTL", "3600"))
+
+
+def _sizeof(value):
+    """Rough in-memory size of a cached value in bytes."""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=False).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=False))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_sizeof(v) for v in value.values())
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(_sizeof(v) for v in value)
+    if type(value).__module__.startswith("plotly.") and hasattr(value, "to_json"):
+        # figures keep their data in nested dicts that getsizeof does not see
+        return len(value.to_json())
+    return sys.getsizeof(value)
+
+
+def normalize_selection(selection):
+    """Order-independent, hashable form of a district selection (None = all)."""
+    if selection is None:
+        return None
+    return tuple(sorted(set(selection)))
+
+
+class SharedCache:
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES, ttl=TTL_SECS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._entries = OrderedDict()    # key -> (expires, size, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """(True, value) on a hit, (False, None) otherwise."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[2]
+
+    def put(self, key, value):
+        size = _sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.bytes -= size
+
+    def invalidate(self, dataset=None, output_id=None):
+        """Drops all entries, or only those of one dataset version and/or output id."""
+        with self._lock:
+            keys = [k for k in self._entries
+                    if (dataset is None or k[1] == dataset) and (output_id is None or k[0] == output_id)]
+            for key in keys:
+                self._drop(key)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.bytes, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions}
+
+
+_cache = SharedCache()
+
+
+def cached(output_id, dataset, selection, compute):
+    """
+    Value of compute() for (output id, dataset version, selection), shared by all sessions.
+    dataset: a token that changes whenever the underlying data does (e.g. cube.version).
+    Callers must not mutate the returned value.
+    """
+    key = (output_id, dataset, normalize_selection(selection))
+    hit, value = _cache.get(key)
+    if hit:
+        return value
+    value = compute()
+    _cache.put(key, value)
+    return value
+
+
+def invalidate(dataset=None, output_id=None):
+    _cache.invalidate(dataset, output_id)
+
+
+def stats():
+    return _cache.stats()
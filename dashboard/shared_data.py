@@ -0,0 +1,144 @@
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import data_cache
+import frequency_index
+import population_cube
+
+# Read-only dataset generations shared by all workers of a multi-worker deployment.
+# A generation is a directory under .cache/shared/ named after the fingerprint of its
+# sources. It holds the tables as uncompressed Arrow IPC files and the population cubes
+# as .npy. Workers map these files read-only: numeric columns and cube counts are
+# zero-copy views of the page cache, and string columns are stored as dictionaries. So
+# memory stays flat when more workers are added. The CURRENT file names the live
+# generation. prepare() writes a new generation next to the old one and then replaces
+# CURRENT atomically. Workers pick it up on their next refresh and keep serving
+# the old mapping until then.
+#
+#   python shared_data.py      # prepare a generation from Input/ and make it current
+
+SHARED_DIR = data_cache.CACHE_DIR / "shared"
+CURRENT = SHARED_DIR / "CURRENT"
+KEEP_GENERATIONS = 3
+CATEGORY_MAX_SHARE = 0.5       # string columns with fewer distinct values are dictionary-encoded
+
+_lock = threading.Lock()
+
+
+class Generation:
+    """
+    name: directory name (source fingerprint)
+    tables: name -> DataFrame backed by memory-mapped Arrow buffers
+    cubes: name -> PopulationCube (or FrequencyIndex) backed by memory-mapped counts
+    """
+
+    def __init__(self, name, tables, cubes):
+        self.name = name
+        self.tables = tables
+        self.cubes = cubes
+
+
+def _compact(df):
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype == object or pd.api.types.is_string_dtype(df[col].dtype):
+            if df[col].nunique(dropna=True) <= CATEGORY_MAX_SHARE * max(len(df), 1):
+                df[col] = df[col].astype("category")
+    return df
+
+
+def generation_name(sources):
+    """Fingerprint over all source files; sources: name -> path."""
+    return "gen-" + "-".join(data_cache.fingerprint(p)[:8] for _, p in sorted(sources.items()))
+
+
+def _write(target, tables, cubes):
+    from pyarrow import feather
+
+    tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    meta = {"tables": sorted(tables), "cubes": {}}
+    for name, df in tables.items():
+        feather.write_feather(_compact(df), tmp / f"{name}.arrow", compression="uncompressed")
+    for name, cube in cubes.items():
+        np.save(tmp / f"{name}.npy", np.ascontiguousarray(cube.counts))
+        meta["cubes"][name] = {"districts": list(cube.districts), "has_districts": cube.has_districts}
+        if isinstance(cube, frequency_index.FrequencyIndex):
+            meta["cubes"][name]["categories"] = cube.categories
+    (tmp / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+    try:
+        os.rename(tmp, target)
+    except OSError:
+        # another worker prepared the same generation first
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _set_current(name):
+    tmp = CURRENT.with_name(f".CURRENT.{os.getpid()}")
+    tmp.write_text(name, encoding="utf-8")
+    os.replace(tmp, CURRENT)
+
+
+def _prune(keep):
+    gens = sorted((p for p in SHARED_DIR.glob("gen-*") if p.is_dir()), key=lambda p: p.stat().st_mtime)
+    for p in gens[:-KEEP_GENERATIONS]:
+        if p.name != keep:
+            shutil.rmtree(p, ignore_errors=True)
+
+
+def prepare(sources, load):
+    """
+    Builds the generation for sources (name -> path) unless it exists and makes it current.
+    load() -> (tables, cubes) is only called when the generation has to be written.
+    """
+    name = generation_name(sources)
+    target = SHARED_DIR / name
+    with _lock:
+        if not (target / "meta.json").exists():
+            SHARED_DIR.mkdir(parents=True, exist_ok=True)
+            _write(target, *load())
+        _set_current(name)
+        _prune(name)
+    return name
+
+
+def current_name():
+    try:
+        return CURRENT.read_text(encoding="utf-8").strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def open_generation(name):
+    """Maps a generation read-only."""
+    from pyarrow import feather
+
+    path = SHARED_DIR / name
+    meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+    tables = {
+        t: feather.read_table(path / f"{t}.arrow", memory_map=True).to_pandas(split_blocks=True)
+        for t in meta["tables"]
+    }
+    cubes = {}
+    for c, m in meta["cubes"].items():
+        counts = np.load(path / f"{c}.npy", mmap_mode="r")
+        if "categories" in m:
+            cubes[c] = frequency_index.FrequencyIndex(counts, m["districts"], m["has_districts"], m["categories"])
+        else:
+            cubes[c] = population_cube.PopulationCube(counts, m["districts"], m["has_districts"])
+    return Generation(name, tables, cubes)
+
+
+if __name__ == "__main__":
+    os.environ["DASHBOARD_SHARED_DATA"] = "0"    # load from the sources, not from a generation
+    import datasets
+
+    name = prepare(datasets.SOURCES, datasets.load_sources)
+    print(f"current generation: {Path(SHARED_DIR / name)}")
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the dashboard modules are imported top-level (as in app.py)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+import data_cache
+import elections
+
+# Small precinct fixtures: four precincts, three of them mapped to two districts by
+# wahlbezirke.csv, 900 (Briefwahl) without a district.
+DISTRICTS = {"Mitte": "1", "Süd": "2"}
+
+WIDE = """Wahlbezirk,Wahlberechtigte,Wähler,Ungültige,CDU,SPD,Grüne
+100,1000,600,2,300,200,98
+101,800,400,1,100,250,49
+200,500,250,0,50,50,150
+900,0,300,3,120,90,87
+"""
+
+LONG = """Wahlbezirk,Partei,Stimmen,Wahlberechtigte,Wähler
+100,CDU,250,1000,550
+100,SPD,300,1000,550
+101,CDU,150,800,380
+101,SPD,230,800,380
+200,CDU,100,500,200
+200,SPD,100,500,200
+"""
+
+PRECINCTS = """Wahlbezirk,Stadtteil
+100,Mitte
+101,Mitte
+200,Süd
+"""
+
+
+@pytest.fixture
+def elections_dir(tmp_path, monkeypatch):
+    (tmp_path / "gemeinderatswahl_2024.csv").write_text(WIDE, encoding="utf-8")
+    (tmp_path / "gemeinderatswahl_2019.csv").write_text(LONG, encoding="utf-8")
+    (tmp_path / "wahlbezirke.csv").write_text(PRECINCTS, encoding="utf-8")
+    monkeypatch.setattr(elections, "ELECTIONS_DIR", tmp_path)
+    monkeypatch.setattr(data_cache, "CACHE_DIR", tmp_path / ".cache")
+    monkeypatch.setattr(elections, "_catalog", None)
+    # district names -> IDs without the district geometry
+    monkeypatch.setattr(elections, "_resolve", lambda value: DISTRICTS.get(value, ""))
+    return tmp_path
+
+
+def test_precinct_lookup(elections_dir):
+    assert elections.precinct_districts() == {"100": "1", "101": "1", "200": "2"}
+
+
+def test_wide_file_rolls_up_to_districts(elections_dir):
+    election = elections.load(elections_dir / "gemeinderatswahl_2024.csv")
+    assert election.label == "Gemeinderatswahl 2024" and election.year == 2024
+    assert election.parties == ("CDU", "SPD", "Grüne")
+    assert election.district_of == ("1", "1", "2", "")
+
+    mitte = election.result(["1"])
+    np.testing.assert_array_equal(mitte.votes, [400, 450, 147])
+    assert (mitte.eligible, mitte.voters) == (1800, 1000)
+    assert mitte.turnout == pytest.approx(1000 / 1800 * 100)
+    assert mitte.shares.sum() == pytest.approx(100)
+
+    both = election.result(["1", "2"])
+    np.testing.assert_array_equal(both.votes, [450, 500, 297])
+    # the unmapped Briefwahl precinct only counts city-wide
+    np.testing.assert_array_equal(election.result().votes, [570, 590, 384])
+    np.testing.assert_array_equal(election.result(["1", "unknown"]).votes, mitte.votes)
+
+
+def test_long_file_and_swing(elections_dir):
+    catalog = elections.catalog()
+    assert list(catalog) == ["gemeinderatswahl_2019", "gemeinderatswahl_2024"]
+    before, now = catalog["gemeinderatswahl_2019"], catalog["gemeinderatswahl_2024"]
+    np.testing.assert_array_equal(before.result(["2"]).votes, [100, 100])
+    assert before.result(["1"]).turnout == pytest.approx(930 / 1800 * 100)
+
+    change = elections.swing(now, before, ["2"])
+    assert change[0] == pytest.approx(50 / 250 * 100 - 50)        # CDU
+    assert np.isnan(change[2])                                     # Grüne did not run
+
+
+def test_catalog_follows_source_files(elections_dir):
+    first = elections.catalog()
+    assert elections.catalog() is first
+    (elections_dir / "wahlbezirke.csv").write_text(PRECINCTS.replace("200,Süd", "200,Mitte"), encoding="utf-8")
+    rebuilt = elections.catalog()
+    assert rebuilt is not first
+    assert rebuilt["gemeinderatswahl_2024"].district_ids == ("1",)
@@ -0,0 +1,375 @@
+import multiprocessing
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import data_cache
+import facilities
+import geometry_store
+
+# Offline ÖPNV reachability from a local GTFS feed (Connection Scan Algorithm).
+# The feed is flattened once into connection arrays sorted by departure time
+# (dep_stop, arr_stop, dep_time, arr_time, trip) plus walking footpaths between stops
+# within MAX_WALK metres, and stored as .npz under .cache/transit/ keyed by the feed's
+# fingerprint. Queries scan only the connections inside their time window:
+#   earliest_arrival   forward, multi-source  -> isochrones around a point
+#   latest_departure   backward, multi-target -> minutes to the city centre from every stop
+# "Minuten bis Mitte" for a departure-time window runs one backward scan per arrival
+# time in a process pool and is cached on disk per window.
+#
+#   python transit.py 07:00 09:00     # precompute a window ahead of deployment
+#
+# The accessibility grid (and with it the district layer) is imported where it is used,
+# so the spawn workers of the pool only load the timetable and the district geometry.
+
+FEED_PATH = Path(os.environ.get("DASHBOARD_GTFS", data_cache.INPUT_DIR / "gtfs.zip"))
+CACHE_DIR = data_cache.CACHE_DIR / "transit"
+CACHE_FORMAT = 1
+SERVICE_DAY = "tuesday"        # calendar.txt column used to pick a regular weekday
+WALK_SPEED = 1.2               # m/s
+MAX_WALK = 400                 # metres, stop-to-stop footpaths and cell-to-stop access
+MAX_TRAVEL = 90 * 60           # seconds scanned per query
+WINDOW_STEP = 10 * 60          # seconds between arrival times of a window
+CENTRE_DISTRICT = "11"         # Mitte
+ISOCHRONE_MINUTES = (15, 30, 45)
+
+_timetable = None
+_trees = {}                    # id(Timetable) -> cKDTree of its stops
+_lock = threading.Lock()
+_executor = None
+
+
+class Timetable:
+    """
+    stop_ids / xy: GTFS stop_id and UTM32 position per stop
+    dep_stop, arr_stop, dep_time, arr_time, trip: one entry per connection (int32,
+        seconds after midnight), sorted by dep_time; by_arrival sorts them by arr_time
+    fp_ptr, fp_to, fp_secs: footpaths in CSR form (walking seconds)
+    """
+
+    def __init__(self, arrays):
+        for name, value in arrays.items():
+            setattr(self, name, value)
+        self.n_stops = len(self.stop_ids)
+        self.n_trips = int(self.trip.max()) + 1 if len(self.trip) else 0
+
+    def footpaths(self, stop):
+        lo, hi = self.fp_ptr[stop], self.fp_ptr[stop + 1]
+        return self.fp_to[lo:hi], self.fp_secs[lo:hi]
+
+
+def _seconds(values):
+    # GTFS times may exceed 24:00:00 for trips after midnight
+    parts = values.astype(str).str.split(":", expand=True).astype(np.int32)
+    return (parts[0] * 3600 + parts[1] * 60 + parts[2]).to_numpy(dtype=np.int32)
+
+
+def _read(feed, name, **kwargs):
+    with feed.open(name) as f:
+        return pd.read_csv(f, dtype=str, **kwargs)
+
+
+def _build_arrays(path):
+    from scipy.spatial import cKDTree
+
+    with zipfile.ZipFile(path) as feed:
+        names = set(feed.namelist())
+        stops = _read(feed, "stops.txt", usecols=["stop_id", "stop_lat", "stop_lon"])
+        trips = _read(feed, "trips.txt", usecols=["trip_id", "service_id"])
+        stop_times = _read(feed, "stop_times.txt",
+                           usecols=["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence"])
+        if "calendar.txt" in names:
+            calendar = _read(feed, "calendar.txt", usecols=["service_id", SERVICE_DAY])
+            services = set(calendar.loc[calendar[SERVICE_DAY] == "1", "service_id"])
+            trips = trips[trips["service_id"].isin(services)]
+
+    stop_index = pd.Index(stops["stop_id"])
+    x, y = geometry_store.to_utm32(stops["stop_lon"].astype(float), stops["stop_lat"].astype(float))
+    xy = np.column_stack([x, y])
+
+    st = stop_times[stop_times["trip_id"].isin(trips["trip_id"])].dropna(subset=["arrival_time", "departure_time"])
+    st = st.assign(seq=st["stop_sequence"].astype(int)).sort_values(["trip_id", "seq"], kind="stable")
+    trip_codes = pd.factorize(st["trip_id"])[0].astype(np.int32)
+    stop_codes = stop_index.get_indexer(st["stop_id"]).astype(np.int32)
+    arr, dep = _seconds(st["arrival_time"]), _seconds(st["departure_time"])
+
+    # consecutive stops of the same trip form one connection
+    same = trip_codes[1:] == trip_codes[:-1]
+    conn = {
+        "dep_stop": stop_codes[:-1][same], "arr_stop": stop_codes[1:][same],
+        "dep_time": dep[:-1][same], "arr_time": arr[1:][same], "trip": trip_codes[:-1][same],
+    }
+    order = np.argsort(conn["dep_time"], kind="stable")
+    conn = {k: v[order] for k, v in conn.items()}
+
+    pairs = cKDTree(xy).query_pairs(MAX_WALK, output_type="ndarray")
+    src = np.concatenate([pairs[:, 0], pairs[:, 1]])
+    dst = np.concatenate([pairs[:, 1], pairs[:, 0]])
+    secs = (np.linalg.norm(xy[src] - xy[dst], axis=1) / WALK_SPEED).astype(np.int32)
+    order = np.argsort(src, kind="stable")
+    fp_ptr = np.concatenate([[0], np.cumsum(np.bincount(src, minlength=len(xy)))]).astype(np.int64)
+
+    return dict(
+        conn,
+        by_arrival=np.argsort(conn["arr_time"], kind="stable").astype(np.int64),
+        stop_ids=stop_index.to_numpy(dtype=str), xy=xy,
+        fp_ptr=fp_ptr, fp_to=dst[order].astype(np.int32), fp_secs=secs[order],
+    )
+
+
+def feed_available():
+    return FEED_PATH.exists()
+
+
+def _arrays_path():
+    digest = data_cache.fingerprint(FEED_PATH, reader="gtfs", fmt=CACHE_FORMAT, day=SERVICE_DAY, walk=MAX_WALK)
+    return CACHE_DIR / f"timetable-{digest}.npz"
+
+
+def _store_npz(target, **arrays):
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f".{target.stem}.{os.getpid()}.npz")
+    np.savez(tmp, **arrays)
+    os.replace(tmp, target)
+
+
+@lru_cache(maxsize=2)
+def _load_timetable(path):
+    with np.load(path) as data:
+        return Timetable({k: data[k] for k in data.files})
+
+
+def timetable():
+    """The process-wide Timetable of FEED_PATH (built and cached on first use)."""
+    global _timetable
+    if _timetable is None:
+        with _lock:
+            if _timetable is None:
+                path = _arrays_path()
+                if not path.exists():
+                    _store_npz(path, **_build_arrays(FEED_PATH))
+                _timetable = _load_timetable(path)
+    return _timetable
+
+
+def reset():
+    """
+    Drops the timetable, the stop trees, the isochrones and the worker pool (whose
+    processes hold their own district geometry); the feed or the geometry changed.
+    """
+    global _timetable, _executor
+    with _lock:
+        _timetable = None
+        _trees.clear()
+        executor, _executor = _executor, None
+    _load_timetable.cache_clear()
+    isochrones.cache_clear()
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _near_stops(tt, xy):
+    """(cells, k) stop indices and walking seconds within MAX_WALK (stop index n_stops = none)."""
+    dist, idx = _stop_tree(tt).query(np.asarray(xy, dtype=float).reshape(-1, 2), k=8,
+                                     distance_upper_bound=MAX_WALK, workers=-1)
+    return idx, dist / WALK_SPEED
+
+
+def _stop_tree(tt):
+    from scipy.spatial import cKDTree
+
+    tree = _trees.get(id(tt))
+    if tree is None:
+        tree = _trees[id(tt)] = cKDTree(tt.xy)
+    return tree
+
+
+def earliest_arrival(tt, sources, walk_secs, t0):
+    """Forward CSA: earliest arrival (s) at every stop from source stops reached at t0 + walk_secs."""
+    best = np.full(tt.n_stops, np.inf)
+    np.minimum.at(best, sources, t0 + np.asarray(walk_secs, dtype=float))
+    for s in np.flatnonzero(np.isfinite(best)):
+        to, secs = tt.footpaths(s)
+        np.minimum.at(best, to, best[s] + secs)
+
+    lo, hi = np.searchsorted(tt.dep_time, [t0, t0 + MAX_TRAVEL])
+    best_l = best.tolist()
+    on_trip = bytearray(tt.n_trips)
+    ds, as_, dt, at, tr = (a[lo:hi].tolist() for a in (tt.dep_stop, tt.arr_stop, tt.dep_time, tt.arr_time, tt.trip))
+    for i in range(hi - lo):
+        if on_trip[tr[i]] or best_l[ds[i]] <= dt[i]:
+            on_trip[tr[i]] = 1
+            stop, t = as_[i], at[i]
+            if t < best_l[stop]:
+                best_l[stop] = t
+                to, secs = tt.footpaths(stop)
+                for u, w in zip(to.tolist(), secs.tolist()):
+                    if t + w < best_l[u]:
+                        best_l[u] = t + w
+    return np.array(best_l)
+
+
+def latest_departure(tt, targets, walk_secs, deadline):
+    """Backward CSA: latest departure (s) from every stop to reach a target stop by deadline."""
+    best = np.full(tt.n_stops, -np.inf)
+    np.maximum.at(best, targets, deadline - np.asarray(walk_secs, dtype=float))
+    for s in np.flatnonzero(np.isfinite(best)):
+        to, secs = tt.footpaths(s)
+        np.maximum.at(best, to, best[s] - secs)
+
+    arr_sorted = tt.arr_time[tt.by_arrival]
+    lo, hi = np.searchsorted(arr_sorted, [deadline - MAX_TRAVEL, deadline], side="right")
+    idx = tt.by_arrival[lo:hi][::-1]
+    best_l = best.tolist()
+    on_trip = bytearray(tt.n_trips)
+    ds, as_, dt, at, tr = (a[idx].tolist() for a in (tt.dep_stop, tt.arr_stop, tt.dep_time, tt.arr_time, tt.trip))
+    for i in range(len(idx)):
+        if on_trip[tr[i]] or best_l[as_[i]] >= at[i]:
+            on_trip[tr[i]] = 1
+            stop, t = ds[i], dt[i]
+            if t > best_l[stop]:
+                best_l[stop] = t
+                to, secs = tt.footpaths(stop)
+                for u, w in zip(to.tolist(), secs.tolist()):
+                    if t - w > best_l[u]:
+                        best_l[u] = t - w
+    return np.array(best_l)
+
+
+def _centre_targets(tt):
+    """Stops inside the centre district with zero walk to the target."""
+    import shapely
+
+    store = geometry_store.districts()
+    row = np.flatnonzero(store.utm[facilities.ID_COL].astype(str).to_numpy() == CENTRE_DISTRICT)
+    if not len(row):
+        raise KeyError(f"district {CENTRE_DISTRICT} not in {geometry_store.SOURCE_PATH}")
+    inside = shapely.contains_xy(store.utm.geometry.iloc[row[0]], tt.xy[:, 0], tt.xy[:, 1])
+    return np.flatnonzero(inside)
+
+
+def _window_task(path, deadline):
+    tt = _load_timetable(path)
+    targets = _centre_targets(tt)
+    return deadline - latest_departure(tt, targets, np.zeros(len(targets)), deadline)
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        workers = max(1, min(os.cpu_count() or 1, 8))
+        _executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def _clock(value):
+    h, m = (int(v) for v in value.split(":")[:2])
+    return h * 3600 + m * 60
+
+
+def stop_minutes_to_centre(window=("07:00", "09:00")):
+    """
+    Median minutes from every stop to the centre over arrival times in window
+    (every WINDOW_STEP); inf where the centre is not reachable within MAX_TRAVEL.
+    Cached on disk per feed, district geometry and window.
+    """
+    path = _arrays_path()
+    timetable()
+    start, end = (_clock(v) for v in window)
+    # the centre targets come from the district geometry
+    districts = data_cache.fingerprint(geometry_store.SOURCE_PATH)[:8]
+    target = CACHE_DIR / f"{path.stem}-centre-{start}-{end}-{WINDOW_STEP}-{districts}.npy"
+    if target.exists():
+        return np.load(target)
+
+    deadlines = list(range(start, end + 1, WINDOW_STEP))
+    runs = list(_pool().map(_window_task, [path] * len(deadlines), deadlines))
+    minutes = np.median(np.stack(runs), axis=0) / 60
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f".{target.stem}.{os.getpid()}.npy")
+    np.save(tmp, minutes)
+    os.replace(tmp, target)
+    return minutes
+
+
+def cell_minutes_to_centre(window=("07:00", "09:00")):
+    """Minutes to the centre per accessibility grid cell (walk to a stop + ride, or walk only)."""
+    import accessibility
+
+    tt = timetable()
+    per_stop = np.append(stop_minutes_to_centre(window), np.inf)    # index n_stops = no stop
+    g = accessibility.grid()
+    idx, walk = _near_stops(tt, g.xy)
+    via_stop = (per_stop[idx] + walk / 60).min(axis=1)
+
+    centre = _centre_targets(tt)
+    walk_only = np.full(len(g.xy), np.inf)
+    if len(centre):
+        from scipy.spatial import cKDTree
+        d, _ = cKDTree(tt.xy[centre]).query(g.xy, k=1, workers=-1)
+        walk_only = d / WALK_SPEED / 60
+    return np.minimum(via_stop, walk_only)
+
+
+def district_minutes_to_centre(window=("07:00", "09:00")):
+    """Residents-weighted mean minutes to the centre per district ID (NaN if unreachable)."""
+    import accessibility
+
+    g = accessibility.grid()
+    minutes = cell_minutes_to_centre(window)
+    store = geometry_store.districts()
+    n = len(store.utm)
+    ok = np.isfinite(minutes)
+    num = np.bincount(g.district[ok], weights=g.weight[ok] * minutes[ok], minlength=n)
+    den = np.bincount(g.district[ok], weights=g.weight[ok], minlength=n)
+    return pd.Series(np.divide(num, den, out=np.full(n, np.nan), where=den > 0),
+                     index=store.utm[facilities.ID_COL].astype(str).to_numpy(), name="minuten_bis_mitte")
+
+
+@lru_cache(maxsize=64)
+def isochrones(lon, lat, departure="08:00", minutes=ISOCHRONE_MINUTES):
+    """
+    GeoJSON FeatureCollection (WGS84) with one polygon per travel-time limit from a
+    point, built from the accessibility grid cells reached in time.
+    """
+    import accessibility
+
+    import shapely
+
+    tt = timetable()
+    t0 = _clock(departure)
+    x, y = geometry_store.to_utm32(lon, lat)
+    idx, walk = _near_stops(tt, [[float(x), float(y)]])
+    ok = idx[0] < tt.n_stops
+    arrival = np.append(earliest_arrival(tt, idx[0][ok], walk[0][ok], t0), np.inf)
+
+    g = accessibility.grid()
+    cell_idx, cell_walk = _near_stops(tt, g.xy)
+    reach = (arrival[cell_idx] + cell_walk).min(axis=1)
+    direct = t0 + np.hypot(g.xy[:, 0] - float(x), g.xy[:, 1] - float(y)) / WALK_SPEED
+    reach = (np.minimum(reach, direct) - t0) / 60
+
+    half = accessibility.CELL_SIZE / 2
+    features = []
+    for limit in sorted(minutes, reverse=True):
+        cells = g.xy[reach <= limit]
+        if not len(cells):
+            continue
+        area = shapely.union_all(shapely.box(cells[:, 0] - half, cells[:, 1] - half, cells[:, 0] + half, cells[:, 1] + half))
+        area = shapely.transform(area, lambda c: np.column_stack(geometry_store.to_wgs84(c[:, 0], c[:, 1])))
+        features.append({"type": "Feature", "properties": {"minuten": limit},
+                         "geometry": shapely.geometry.mapping(area)})
+    return {"type": "FeatureCollection", "features": features}
+
+
+if __name__ == "__main__":
+    import sys
+
+    window = tuple(sys.argv[1:3]) if len(sys.argv) >= 3 else ("07:00", "09:00")
+    print(district_minutes_to_centre(window).round(1).to_string())
@@ -0,0 +1,64 @@
+import sys
+import time
+
+import datasets
+import district_layer
+import district_metrics
+import elections
+import facilities
+import figures
+import forecast
+import num_data
+import pyramid_years
+
+# Warm-up stage at process start (asgi.py lifespan, before the first request).
+# Builds the figures, KPIs and lookup tables of the default view ("all districts") and
+# of every single-district view into shared_cache, so the first paint of a session is
+# a cache read. Plotly outputs are kept as their finished HTML fragments (plotly_output.py),
+# so a render sends the cached string without building or serializing a figure.
+#
+#   python warmup.py      # run the stage once and print the report
+
+last_seconds = None      # duration of the last run, exported on /metrics
+
+
+def _district_ids(selection):
+    reg = district_layer.registry()
+    return [i for i in (reg.district_id(name) for name in selection) if i]
+
+
+def _steps():
+    cube, kos_cube, kos_freq = datasets.pyr_cube, datasets.kos_cube, datasets.kos_freq
+    for selection in [datasets.STADTTEILE] + [[name] for name in datasets.STADTTEILE]:
+        yield "alterspyramide", lambda s=selection: figures.pyramid(cube, s)
+        yield "forecast_plot", lambda s=selection: figures.forecast_plot(cube, s, forecast.Scenario())
+        yield "kpis", lambda s=selection: num_data.compute_kpis(kos_cube, s)
+        for column in figures.PIE_OUTPUTS:
+            yield "pies", lambda s=selection, c=column: figures.pie(kos_freq, c, s)
+        if elections.latest() is not None:
+            yield "election", lambda s=selection: figures.election(elections.latest(), _district_ids(s))
+    yield "pyramid_years_plot", lambda: pyramid_years.figure_html("overlay", pyramid_years.YEARS)
+    yield "facilities", facilities.district_table
+    yield "choropleth", lambda: district_metrics.choropleths(kos_cube)
+
+
+def run():
+    """Runs all warm-up steps; a failing step is reported and skipped. Returns seconds."""
+    global last_seconds
+    start = time.perf_counter()
+    timings = {}
+    for name, step in _steps():
+        t = time.perf_counter()
+        try:
+            step()
+        except Exception as e:  # noqa: BLE001 - warm-up must never block startup
+            print(f"warm-up: {name} failed: {e}", file=sys.stderr)
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - t
+    last_seconds = time.perf_counter() - start
+    detail = ", ".join(f"{name} {seconds:.2f} s" for name, seconds in timings.items())
+    print(f"warm-up: {last_seconds:.2f} s ({detail})", file=sys.stderr, flush=True)
+    return last_seconds
+
+
+if __name__ == "__main__":
+    run()